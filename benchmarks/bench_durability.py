@@ -14,68 +14,89 @@ import tempfile
 import threading
 import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from kvstore.client import KVClient
 
 
+def _wait_ready(c: KVClient, timeout: float = 5.0) -> bool:
+    """Poll the server every 10 ms until it answers a request, instead of sleeping a fixed time."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            c.get("__ready__", timeout=0.5)
+            return True
+        except Exception:
+            time.sleep(0.01)
+    return False
+
+
 def run_durability_benchmark(
     port: int,
     data_dir: str,
     num_writes: int,
     kill_after_writes: int = 50,
     use_sigkill: bool = False,
+    workers: int = 16,
 ) -> tuple[list[str], list[str], int]:
     """
     Returns (acknowledged_keys, lost_keys_after_restart, total_kills).
+    The writer keeps up to `workers` sets in flight; a key is acknowledged once its set returns.
     """
     root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # One client (and connection pool) for the whole run: readiness probes, writer and verification.
+    c = KVClient(f"http://127.0.0.1:{port}")
     proc = subprocess.Popen(
         ["python", "-m", "kvstore.server", "--port", str(port), "--data-dir", data_dir],
         cwd=root,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
-    time.sleep(0.6)
+    _wait_ready(c)
 
     acknowledged: list[str] = []
-    ack_lock = threading.Lock()
+    ack_cond = threading.Condition()  # guards acknowledged; notified when the killer should act
     kill_count = [0]  # mutable to share
     writer_done = threading.Event()
 
     def writer():
-        base_url = f"http://127.0.0.1:{port}"
-        for i in range(num_writes):
+        failed = threading.Event()
+
+        def write_one(i: int) -> None:
+            if failed.is_set():
+                return
+            key = f"dur_{i}"
             try:
-                c = KVClient(base_url)
-                key = f"dur_{i}"
                 c.set(key, f"v_{i}")
-                with ack_lock:
-                    acknowledged.append(key)
             except Exception:
-                break
-        writer_done.set()
+                failed.set()
+                return
+            with ack_cond:
+                acknowledged.append(key)
+                if len(acknowledged) == kill_after_writes:
+                    ack_cond.notify()
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for f in as_completed([ex.submit(write_one, i) for i in range(num_writes)]):
+                f.result()
+        with ack_cond:
+            writer_done.set()
+            ack_cond.notify()
 
     def killer():
-        while not writer_done.is_set():
-            with ack_lock:
-                n = len(acknowledged)
-            if n >= kill_after_writes and n % kill_after_writes < 5:
-                kill_count[0] += 1
-                if use_sigkill:
-                    proc.send_signal(signal.SIGKILL)
-                else:
-                    proc.terminate()
-                return
-            time.sleep(0.02)
-        time.sleep(0.1)
-        if not writer_done.is_set():
-            kill_count[0] += 1
-            if use_sigkill:
-                proc.send_signal(signal.SIGKILL)
-            else:
-                proc.terminate()
+        with ack_cond:
+            ack_cond.wait_for(
+                lambda: len(acknowledged) >= kill_after_writes or writer_done.is_set(), timeout=30
+            )
+            if writer_done.is_set():
+                return  # all writes finished before the kill point
+        kill_count[0] += 1
+        if use_sigkill:
+            proc.send_signal(signal.SIGKILL)
+        else:
+            proc.terminate()
 
     t1 = threading.Thread(target=writer)
     t2 = threading.Thread(target=killer)
@@ -89,7 +110,6 @@ def run_durability_benchmark(
         proc.kill()
         proc.wait(timeout=2)
 
-    time.sleep(0.3)
     # Restart
     proc2 = subprocess.Popen(
         ["python", "-m", "kvstore.server", "--port", str(port), "--data-dir", data_dir],
@@ -97,10 +117,9 @@ def run_durability_benchmark(
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
-    time.sleep(0.8)
+    _wait_ready(c)
     lost = []
     try:
-        c = KVClient(f"http://127.0.0.1:{port}")
         for key in acknowledged:
             v = c.get(key)
             if v is None:
@@ -117,7 +136,6 @@ def run_durability_benchmark(
 
 
 def main():
-    import signal
     port = 29100
     data_dir = tempfile.mkdtemp(prefix="bench_dur_")
     use_sigkill = getattr(signal, "SIGKILL", None) is not None
@@ -9,6 +9,7 @@ import sys
 import tempfile
 import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Add project root
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -16,8 +17,27 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from kvstore.client import KVClient
 
 
-def run_throughput_benchmark(port: int, data_dir: str, num_preexisting: int, num_writes: int) -> float:
-    """Start server, optionally pre-populate, then measure write throughput. Returns writes/sec."""
+def _parallel_writes(client: KVClient, n: int, workers: int = 16) -> None:
+    """Issue n individual sets with up to `workers` requests in flight on the client's shared pool."""
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(client.set, f"bench_{i}", f"data_{i}") for i in range(n)]
+        for f in as_completed(futures):
+            f.result()
+
+
+def run_throughput_benchmark(
+    port: int,
+    data_dir: str,
+    num_preexisting: int,
+    num_writes: int,
+    batch_size: int = 128,
+    workers: int = 1,
+) -> float:
+    """
+    Start server, optionally pre-populate, then measure write throughput. Returns writes/sec.
+    Writes are sent as bulk_set batches of `batch_size` items (batch_size=1 sends one set per write).
+    With workers > 1, individual sets are sent concurrently from a thread pool instead.
+    """
     root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     proc = subprocess.Popen(
         ["python", "-m", "kvstore.server", "--port", str(port), "--data-dir", data_dir],
@@ -30,14 +50,16 @@ def run_throughput_benchmark(port: int, data_dir: str, num_preexisting: int, num
         client = KVClient(f"http://127.0.0.1:{port}")
         # Pre-populate
         if num_preexisting > 0:
-            batch = 500
-            for start in range(0, num_preexisting, batch):
-                chunk = [(f"pre_{i}", f"value_{i}") for i in range(start, min(start + batch, num_preexisting))]
-                client.bulk_set(chunk)
+            client.bulk_set_stream(((f"pre_{i}", f"value_{i}") for i in range(num_preexisting)), batch=500)
         # Measure writes
         t0 = time.perf_counter()
-        for i in range(num_writes):
-            client.set(f"bench_{i}", f"data_{i}")
+        if workers > 1:
+            _parallel_writes(client, num_writes, workers)
+        elif batch_size > 1:
+            client.bulk_set_stream(((f"bench_{i}", f"data_{i}") for i in range(num_writes)), batch=batch_size)
+        else:
+            for i in range(num_writes):
+                client.set(f"bench_{i}", f"data_{i}")
         t1 = time.perf_counter()
         return num_writes / (t1 - t0)
     finally:
@@ -50,14 +72,23 @@ def run_throughput_benchmark(port: int, data_dir: str, num_preexisting: int, num
 
 
 def main():
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument("--batch-size", type=int, default=128, help="Writes per bulk_set request (1 = individual sets)")
+    p.add_argument("--num-writes", type=int, default=2000)
+    p.add_argument("--workers", type=int, default=1, help="Concurrent individual sets (overrides --batch-size)")
+    args = p.parse_args()
     port_base = 29000
-    num_writes = 2000
-    print("Write throughput (writes/sec) vs pre-populated keys")
+    num_writes = args.num_writes
+    mode = f"{args.workers} workers" if args.workers > 1 else f"batch size {args.batch_size}"
+    print(f"Write throughput (writes/sec) vs pre-populated keys ({mode})")
     print("-" * 50)
     for pre in [0, 1000, 5000, 10000, 20000]:
         data_dir = tempfile.mkdtemp(prefix="bench_")
         try:
-            wps = run_throughput_benchmark(port_base + pre % 1000, data_dir, pre, num_writes)
+            wps = run_throughput_benchmark(
+                port_base + pre % 1000, data_dir, pre, num_writes, args.batch_size, args.workers
+            )
             print(f"  Pre-populated {pre:6d} keys -> {wps:.1f} writes/sec")
         finally:
             shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,41 @@
+"""
+JSON encode/decode helpers shared by the client and servers.
+Uses orjson (bytes in/out, C implementation) when installed; falls back to stdlib json.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    JSONDecodeError = orjson.JSONDecodeError  # subclass of json.JSONDecodeError
+
+    def dumps(obj) -> bytes:
+        """Serialize obj to UTF-8 JSON bytes."""
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which stdlib json still handles
+            return json.dumps(obj).encode("utf-8")
+
+    loads = orjson.loads
+else:
+    JSONDecodeError = json.JSONDecodeError
+
+    def dumps(obj) -> bytes:
+        """Serialize obj to UTF-8 JSON bytes."""
+        return json.dumps(obj).encode("utf-8")
+
+    def loads(raw):
+        """Parse JSON from bytes or str."""
+        return json.loads(raw)
+
+
+def iter_ndjson(raw: bytes):
+    """Yield one decoded value per non-empty line of an NDJSON body."""
+    for line in raw.splitlines():
+        if line.strip():
+            yield loads(line)
@@ -0,0 +1,77 @@
+"""
+Unix domain socket transport for same-host traffic.
+Servers bind to "unix:/path/to.sock" instead of (host, port); replication peers given as
+"unix:/path/to.sock" are reached through UnixHTTPConnection. Remote peers keep using TCP.
+"""
+
+import http.client
+import os
+import socket
+import socketserver
+from typing import Optional
+from urllib.parse import urlsplit
+
+UNIX_PREFIX = "unix:"
+
+
+def unix_path(address) -> Optional[str]:
+    """Socket path of a "unix:/path" address or URL, else None."""
+    if isinstance(address, str) and address.startswith(UNIX_PREFIX):
+        return address[len(UNIX_PREFIX):]
+    return None
+
+
+class UnixServerMixin:
+    """HTTPServer mixin: a "unix:/path" server_address binds an AF_UNIX socket at that path."""
+
+    def __init__(self, server_address, *args, **kwargs):
+        path = unix_path(server_address)
+        if path is not None:
+            self.address_family = socket.AF_UNIX
+            server_address = path
+        super().__init__(server_address, *args, **kwargs)
+
+    def server_bind(self) -> None:
+        if self.address_family != socket.AF_UNIX:
+            super().server_bind()
+            return
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)  # stale socket from a previous run
+        socketserver.TCPServer.server_bind(self)  # HTTPServer.server_bind expects (host, port)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.address_family == socket.AF_UNIX:
+            try:
+                os.unlink(self.server_address)
+            except OSError:
+                pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client connection over a Unix domain socket (Host header is "localhost")."""
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def http_connection(url: str, timeout: float = 5.0) -> http.client.HTTPConnection:
+    """Keep-alive connection for "http://host:port" or "unix:/path" peer URLs."""
+    path = unix_path(url)
+    if path is not None:
+        return UnixHTTPConnection(path, timeout=timeout)
+    parts = urlsplit(url)
+    return http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
@@ -2,10 +2,16 @@
 Client for the key-value store. Uses HTTP over TCP.
 """
 
-import json
-import urllib.request
-import urllib.error
-from typing import Any, Optional
+from itertools import islice
+from typing import Any, Iterable, Optional
+from urllib.parse import quote as _quote
+
+import urllib3
+
+from ._json import JSONDecodeError, dumps, loads
+
+# bulk_set switches to the streamed NDJSON endpoint above this many items.
+_NDJSON_MIN_ITEMS = 64
 
 
 class KVClient:
@@ -15,6 +21,13 @@ class KVClient:
 
     def __init__(self, base_url: str = "http://127.0.0.1:8765"):
         self._base = base_url.rstrip("/")
+        # One keep-alive connection pool per client; reused by every request.
+        self._http = urllib3.PoolManager(
+            num_pools=1,
+            maxsize=32,
+            block=False,
+            headers={"Content-Type": "application/json", "Connection": "keep-alive"},
+        )
 
     def _request(
         self,
@@ -23,29 +36,34 @@ class KVClient:
         body: Optional[dict] = None,
         timeout: float = 30.0,
     ) -> dict:
-        url = self._base + path
         data = None
         if body is not None:
-            data = json.dumps(body).encode("utf-8")
-        req = urllib.request.Request(url, data=data, method=method)
-        req.add_header("Content-Type", "application/json")
-        try:
-            with urllib.request.urlopen(req, timeout=timeout) as resp:
-                return json.loads(resp.read().decode("utf-8"))
-        except urllib.error.HTTPError as e:
-            body = e.read().decode("utf-8")
+            data = dumps(body)
+        return self._request_raw(method, path, data, timeout=timeout)
+
+    def _request_raw(
+        self,
+        method: str,
+        path: str,
+        data: Optional[bytes],
+        content_type: str = "application/json",
+        timeout: float = 30.0,
+    ) -> dict:
+        url = self._base + path
+        headers = {"Content-Type": content_type, "Connection": "keep-alive"}
+        resp = self._http.request(method, url, body=data, headers=headers, timeout=timeout)
+        if resp.status >= 400:
             try:
-                return json.loads(body)
-            except json.JSONDecodeError:
-                return {"error": body, "_status": e.code}
+                return loads(resp.data)
+            except JSONDecodeError:
+                return {"error": resp.data.decode("utf-8", "replace"), "_status": resp.status}
+        return loads(resp.data)
 
     def get(self, key: str, timeout: float = 30.0) -> Optional[Any]:
         """
         Get value for key. Returns None if key does not exist.
         """
-        from urllib.parse import quote
-
-        path = "/get?key=" + quote(key, safe="")
+        path = "/get?key=" + _quote(key, safe="")
         out = self._request("GET", path, timeout=timeout)
         if out.get("found") is True:
             return out.get("value")
@@ -85,23 +103,61 @@ class KVClient:
         debug_flaky: float = 0.0,
         timeout: float = 30.0,
     ) -> None:
-        """Bulk set: items is a list of (key, value) pairs."""
+        """
+        Bulk set: items is a list of (key, value) pairs.
+        Large bulks are sent as NDJSON, encoded one item at a time instead of as one nested list.
+        """
+        if len(items) > _NDJSON_MIN_ITEMS:
+            data = b"".join(dumps({"k": k, "v": v}) + b"\n" for k, v in items)
+            path = "/bulk_set_ndjson"
+            if debug_flaky > 0:
+                path += f"?debug_flaky={debug_flaky}"
+            self._request_raw("POST", path, data, content_type="application/x-ndjson", timeout=timeout)
+            return
         body = {"items": [list(p) for p in items]}
         if debug_flaky > 0:
             body["debug_flaky"] = debug_flaky
         self._request("POST", "/bulk_set", body=body, timeout=timeout)
 
+    def bulk_set_stream(
+        self,
+        items: Iterable[tuple[str, Any]],
+        batch: int = 128,
+        *,
+        timeout: float = 30.0,
+    ) -> int:
+        """
+        Bulk set from any iterable of (key, value) pairs, one bulk_set request per `batch` items.
+        Each batch is atomic on its own; the stream as a whole is not. Returns number of items sent.
+        """
+        it = iter(items)
+        sent = 0
+        while True:
+            chunk = list(islice(it, batch))
+            if not chunk:
+                return sent
+            self.bulk_set(chunk, timeout=timeout)
+            sent += len(chunk)
+
     def search(self, query: str, timeout: float = 30.0) -> list[str]:
         """Full-text search over values. Returns list of keys. Requires server started with --index."""
-        from urllib.parse import quote
-        path = "/search?q=" + quote(query, safe="")
+        path = "/search?q=" + _quote(query, safe="")
         out = self._request("GET", path, timeout=timeout)
         return out.get("keys", [])
 
     def search_similar(self, query: str, top_k: int = 10, timeout: float = 30.0) -> list[tuple[str, float]]:
         """Embedding similarity search. Returns [(key, score), ...]. Requires server with --index."""
-        from urllib.parse import quote
-        path = f"/search_similar?q={quote(query, safe='')}&top_k={top_k}"
+        path = f"/search_similar?q={_quote(query, safe='')}&top_k={top_k}"
         out = self._request("GET", path, timeout=timeout)
         results = out.get("results", [])
         return [(r["key"], r["score"]) for r in results]
+
+    def close(self) -> None:
+        """Close the pooled keep-alive connections."""
+        self._http.clear()
+
+    def __enter__(self) -> "KVClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
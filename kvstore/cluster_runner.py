@@ -3,8 +3,10 @@ Starts a cluster of 3 nodes (1 primary, 2 secondaries) and optionally a coordina
 Coordinator forwards requests to current primary and runs election when primary is down.
 """
 
+import multiprocessing
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import urllib.request
 import json
 import os
@@ -20,6 +22,16 @@ def _get_status(base_url: str, timeout: float = 1.0) -> Optional[dict]:
         return None
 
 
+def _wait_primary_on(base_url: str, timeout: float) -> Optional[dict]:
+    """GET /primary/wait: the node answers once it is primary or after timeout. None if unreachable."""
+    try:
+        url = f"{base_url.rstrip('/')}/primary/wait?timeout={timeout}"
+        with urllib.request.urlopen(url, timeout=timeout + 2.0) as r:
+            return json.loads(r.read().decode())
+    except Exception:
+        return None
+
+
 def _promote(base_url: str, timeout: float = 2.0) -> bool:
     try:
         req = urllib.request.Request(
@@ -34,40 +46,175 @@ def _promote(base_url: str, timeout: float = 2.0) -> bool:
         return False
 
 
+def wait_ready(urls: list[str], timeout: float = 10.0) -> bool:
+    """Poll /status until every node answers (backoff from 5 ms). Returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    pending = list(urls)
+    while pending:
+        pending = [u for u in pending if _get_status(u, timeout=0.5) is None]
+        if not pending:
+            break
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    return True
+
+
+def _ready_or_stop(procs: list, urls: list[str], timeout: float = 10.0) -> None:
+    """wait_ready for freshly started nodes; if any never answers, stop them all and raise RuntimeError."""
+    if wait_ready(urls, timeout=timeout):
+        return
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait(timeout=2)
+    raise RuntimeError(f"cluster nodes did not come up within {timeout}s: {', '.join(urls)}")
+
+
+def _cluster_layout(base_port: int, host: str) -> list[tuple[int, str, list[str]]]:
+    """(port, role, peer URLs) per node: base_port is the primary, the next two its secondaries."""
+    ports = [base_port, base_port + 1, base_port + 2]
+    secondary_urls = [f"http://{host}:{p}" for p in ports[1:]]
+    return [(ports[0], "primary", secondary_urls)] + [(p, "secondary", []) for p in ports[1:]]
+
+
 def run_cluster(
     base_port: int = 8765,
     data_dirs: Optional[list[str]] = None,
     host: str = "127.0.0.1",
+    env: Optional[dict[str, str]] = None,
 ) -> list[subprocess.Popen]:
     """
     Start 3 nodes: base_port (primary), base_port+1, base_port+2 (secondaries).
-    Returns list of 3 Popen processes. Caller must terminate them.
+    Returns list of 3 Popen processes. Caller must terminate them. Raises RuntimeError (after
+    stopping all three) if any node does not answer /status within 10 s.
+    env adds variables (e.g. KV_DEBUG_RESET) to the nodes' environment.
     """
     root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     if data_dirs is None:
         import tempfile
         data_dirs = [tempfile.mkdtemp(prefix="kv_cluster_") for _ in range(3)]
-    ports = [base_port, base_port + 1, base_port + 2]
-    primary_url = f"http://{host}:{ports[0]}"
-    secondary_urls = [f"http://{host}:{p}" for p in ports[1:]]
+    child_env = {**os.environ, **env} if env else None
     procs = []
-    for i, (port, ddir) in enumerate(zip(ports, data_dirs)):
-        role = "primary" if i == 0 else "secondary"
-        peers = ",".join(secondary_urls) if i == 0 else ""
+    for (port, role, peers), ddir in zip(_cluster_layout(base_port, host), data_dirs):
         proc = subprocess.Popen(
             [
                 "python", "-m", "kvstore.cluster_server",
                 "--port", str(port),
                 "--data-dir", ddir,
                 "--role", role,
-                "--peers", peers,
+                "--peers", ",".join(peers),
             ],
             cwd=root,
+            env=child_env,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
         )
         procs.append(proc)
-    time.sleep(1.5)  # allow all nodes to bind
+    _ready_or_stop(procs, [f"http://{host}:{port}" for port, _, _ in _cluster_layout(base_port, host)])
+    return procs
+
+
+# Imported once by the forkserver; every node forked from it starts with these already loaded.
+# kvstore.cluster_server itself is left out: it reads its KV_DEBUG_* flags at import time,
+# so each node imports it after applying its own env.
+_FORKSERVER_PRELOAD = ["kvstore.replicated_store", "http.server"]
+
+
+class NodeProcess:
+    """A node started by multiprocessing, with the part of the Popen API callers of the runners use."""
+
+    def __init__(self, process: multiprocessing.process.BaseProcess):
+        self._process = process
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    def poll(self) -> Optional[int]:
+        return self._process.exitcode
+
+    def send_signal(self, sig: int) -> None:
+        if self._process.exitcode is None:
+            os.kill(self._process.pid, sig)
+
+    def terminate(self) -> None:
+        self._process.terminate()
+
+    def kill(self) -> None:
+        self._process.kill()
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        self._process.join(timeout)
+        if self._process.exitcode is None:
+            raise subprocess.TimeoutExpired(self._process.name, timeout)
+        return self._process.exitcode
+
+
+def _forkserver_context():
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(_FORKSERVER_PRELOAD)
+    return ctx
+
+
+def warm_forkserver() -> None:
+    """
+    Start the forkserver now, so its interpreter start-up and preload imports run in the background
+    while the caller does other work; the first start_node_mp then only pays for a fork.
+    """
+    _forkserver_context()
+    from multiprocessing import forkserver
+    forkserver.ensure_running()
+
+
+def _node_main(host: str, port: int, data_dir: str, role: str, peer_urls: list[str], env: dict) -> None:
+    os.environ.update(env)
+    from .cluster_server import run_cluster_node
+    run_cluster_node(host, port, data_dir, role, peer_urls)
+
+
+def start_node_mp(
+    host: str,
+    port: int,
+    data_dir: str,
+    role: str,
+    peer_urls: list[str],
+    env: Optional[dict[str, str]] = None,
+) -> NodeProcess:
+    """Fork one cluster node from the forkserver (POSIX only) instead of exec'ing a new interpreter."""
+    process = _forkserver_context().Process(
+        target=_node_main,
+        args=(host, port, data_dir, role, peer_urls, env or {}),
+        name=f"kv-node-{port}",
+        daemon=True,
+    )
+    process.start()
+    return NodeProcess(process)
+
+
+def run_cluster_mp(
+    base_port: int = 8765,
+    data_dirs: Optional[list[str]] = None,
+    host: str = "127.0.0.1",
+    env: Optional[dict[str, str]] = None,
+) -> list[NodeProcess]:
+    """Same cluster as run_cluster, with the nodes forked from a forkserver (much faster to start)."""
+    if data_dirs is None:
+        import tempfile
+        data_dirs = [tempfile.mkdtemp(prefix="kv_cluster_") for _ in range(3)]
+    layout = _cluster_layout(base_port, host)
+    procs = [
+        start_node_mp(host, port, ddir, role, peers, env)
+        for (port, role, peers), ddir in zip(layout, data_dirs)
+    ]
+    _ready_or_stop(procs, [f"http://{host}:{port}" for port, _, _ in layout])
     return procs
 
 
@@ -92,7 +239,24 @@ def elect_primary(base_port: int, host: str = "127.0.0.1") -> Optional[str]:
             continue
         if st.get("primary"):
             return url
-        if _promote(url):
-            time.sleep(0.3)
+        if _promote(url) and (_wait_primary_on(url, 2.0) or {}).get("primary"):
             return url
     return None
+
+
+def wait_primary(base_port: int, timeout: float = 2.0, host: str = "127.0.0.1") -> Optional[str]:
+    """
+    Long-poll /primary/wait on all 3 nodes at once; return the URL of the first node that is or
+    becomes primary within timeout, else None. Wakes as soon as a promotion happens.
+    """
+    urls = [f"http://{host}:{base_port + i}" for i in range(3)]
+    ex = ThreadPoolExecutor(max_workers=len(urls))
+    try:
+        futures = {ex.submit(_wait_primary_on, url, timeout): url for url in urls}
+        for fut in as_completed(futures):
+            st = fut.result()
+            if st and st.get("primary"):
+                return futures[fut]
+        return None
+    finally:
+        ex.shutdown(wait=False)  # the other polls end by themselves within timeout
@@ -1,132 +1,254 @@
 """
 HTTP server for replicated KV: primary or secondary role.
 Primary accepts writes and replicates to secondaries; secondary accepts /replicate and /promote_to_primary.
+Replication normally arrives as ordered /replicate/batch requests; the per-op /replicate/* endpoints remain.
 """
 
-import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse
+import os
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 
+from ._json import JSONDecodeError, dumps, iter_ndjson, loads
+from ._unix import UnixServerMixin, unix_path
 from .replicated_store import ReplicatedKVStore
 
+# debug_flaky is a test-only knob; unless KV_DEBUG_FLAKY=1 the request field is ignored entirely.
+_DEBUG_FLAKY_ENABLED = os.environ.get("KV_DEBUG_FLAKY") == "1"
+# POST /_debug/reset wipes the store so test suites can reuse one server; only routed when KV_DEBUG_RESET=1.
+_DEBUG_RESET_ENABLED = os.environ.get("KV_DEBUG_RESET") == "1"
+
 
 class ClusterKVHandler(BaseHTTPRequestHandler):
-    def _parse_body(self) -> dict:
+    # Persistent connections: every response carries Content-Length, and bodies are always read in full.
+    protocol_version = "HTTP/1.1"
+    # Buffer the socket writer so status line, headers and body leave in one send (flushed per request).
+    wbufsize = -1
+
+    def _read_body(self) -> bytes:
         content_length = int(self.headers.get("Content-Length", 0))
         if content_length == 0:
+            return b""
+        return self.rfile.read(content_length)
+
+    def _parse_body(self) -> dict:
+        raw = self._read_body()
+        if not raw:
             return {}
-        raw = self.rfile.read(content_length)
         try:
-            return json.loads(raw.decode("utf-8"))
-        except json.JSONDecodeError:
+            return loads(raw)
+        except JSONDecodeError:
             return {}
 
     def _send_json(self, status: int, body: dict) -> None:
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
-        data = json.dumps(body).encode("utf-8")
+        data = dumps(body)
         self.send_header("Content-Length", str(len(data)))
+        self.send_header("Connection", "keep-alive")
         self.end_headers()
         self.wfile.write(data)
 
-    def do_GET(self) -> None:
-        parsed = urlparse(self.path)
+    # --- GET handlers -------------------------------------------------------
+
+    def _handle_get(self, parsed) -> None:
+        qs = parse_qs(parsed.query)
+        key = qs.get("key", [None])[0]
+        if key is None:
+            self._send_json(400, {"error": "missing key"})
+            return
+        value = self.server.kv.get(key)
+        if value is None:
+            self._send_json(404, {"found": False})
+            return
+        self._send_json(200, {"found": True, "value": value})
+
+    def _handle_status(self, parsed) -> None:
         kv = self.server.kv
-        if parsed.path == "/get":
-            from urllib.parse import parse_qs
-            qs = parse_qs(parsed.query)
-            key = qs.get("key", [None])[0]
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
-            value = kv.get(key)
-            if value is None:
-                self._send_json(404, {"found": False})
-                return
-            self._send_json(200, {"found": True, "value": value})
-        elif parsed.path == "/status":
-            self._send_json(200, {"role": kv.role, "primary": kv.is_primary()})
-        else:
-            self._send_json(404, {"error": "not found"})
+        self._send_json(200, {"role": kv.role, "primary": kv.is_primary()})
 
-    def do_POST(self) -> None:
-        parsed = urlparse(self.path)
-        body = self._parse_body()
+    def _handle_primary_wait(self, parsed) -> None:
+        """Long poll: answer once this node is primary, or after ?timeout= seconds (default 2, max 30)."""
+        qs = parse_qs(parsed.query)
+        try:
+            timeout = min(max(float(qs.get("timeout", [2])[0]), 0.0), 30.0)
+        except ValueError:
+            self._send_json(400, {"error": "invalid timeout"})
+            return
         kv = self.server.kv
+        kv.wait_until_primary(timeout)
+        self._send_json(200, {"role": kv.role, "primary": kv.is_primary()})
 
-        if parsed.path == "/set":
-            if not kv.is_primary():
-                self._send_json(503, {"error": "not primary"})
-                return
-            key, value = body.get("key"), body.get("value")
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
+    # --- POST handlers ------------------------------------------------------
+
+    def _handle_set(self, parsed) -> None:
+        body = self._parse_body()
+        kv = self.server.kv
+        if not kv.is_primary():
+            self._send_json(503, {"error": "not primary"})
+            return
+        key, value = body.get("key"), body.get("value")
+        if key is None:
+            self._send_json(400, {"error": "missing key"})
+            return
+        if _DEBUG_FLAKY_ENABLED:
             kv.set(key, value, debug_flaky=float(body.get("debug_flaky", 0)))
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/delete":
-            if not kv.is_primary():
-                self._send_json(503, {"error": "not primary"})
-                return
-            key = body.get("key")
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
+        else:
+            kv.set(key, value)
+        self._send_json(200, {"ok": True})
+
+    def _handle_delete(self, parsed) -> None:
+        body = self._parse_body()
+        kv = self.server.kv
+        if not kv.is_primary():
+            self._send_json(503, {"error": "not primary"})
+            return
+        key = body.get("key")
+        if key is None:
+            self._send_json(400, {"error": "missing key"})
+            return
+        if _DEBUG_FLAKY_ENABLED:
             kv.delete(key, debug_flaky=float(body.get("debug_flaky", 0)))
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/bulk_set":
-            if not kv.is_primary():
-                self._send_json(503, {"error": "not primary"})
-                return
-            items = body.get("items", [])
-            try:
-                pairs = [tuple(x) for x in items]
-            except (TypeError, ValueError):
-                self._send_json(400, {"error": "invalid items"})
-                return
+        else:
+            kv.delete(key)
+        self._send_json(200, {"ok": True})
+
+    def _handle_bulk_set(self, parsed) -> None:
+        body = self._parse_body()
+        kv = self.server.kv
+        if not kv.is_primary():
+            self._send_json(503, {"error": "not primary"})
+            return
+        items = body.get("items", [])
+        try:
+            pairs = [tuple(x) for x in items]
+        except (TypeError, ValueError):
+            self._send_json(400, {"error": "invalid items"})
+            return
+        if _DEBUG_FLAKY_ENABLED:
             kv.bulk_set(pairs, debug_flaky=float(body.get("debug_flaky", 0)))
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/replicate/set":
-            key, value = body.get("key"), body.get("value")
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
-            kv.apply_replicate_set(key, value)
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/replicate/delete":
-            key = body.get("key")
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
-            kv.apply_replicate_delete(key)
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/replicate/bulk_set":
-            items = body.get("items", [])
-            try:
-                pairs = [tuple(x) for x in items]
-            except (TypeError, ValueError):
-                self._send_json(400, {"error": "invalid items"})
-                return
-            kv.apply_replicate_bulk_set(pairs)
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/promote_to_primary":
-            kv.promote_to_primary()
-            self._send_json(200, {"ok": True, "role": "primary"})
+        else:
+            kv.bulk_set(pairs)
+        self._send_json(200, {"ok": True})
 
+    def _handle_bulk_set_ndjson(self, parsed) -> None:
+        """Bulk set from an NDJSON body: one {"k": key, "v": value} object per line."""
+        raw = self._read_body()
+        kv = self.server.kv
+        if not kv.is_primary():
+            self._send_json(503, {"error": "not primary"})
+            return
+        try:
+            pairs = [(o["k"], o.get("v")) for o in iter_ndjson(raw)]
+        except (JSONDecodeError, KeyError, TypeError):
+            self._send_json(400, {"error": "invalid items"})
+            return
+        if _DEBUG_FLAKY_ENABLED:
+            qs = parse_qs(parsed.query)
+            kv.bulk_set(pairs, debug_flaky=float(qs.get("debug_flaky", [0])[0]))
         else:
+            kv.bulk_set(pairs)
+        self._send_json(200, {"ok": True})
+
+    def _handle_replicate_set(self, parsed) -> None:
+        body = self._parse_body()
+        key, value = body.get("key"), body.get("value")
+        if key is None:
+            self._send_json(400, {"error": "missing key"})
+            return
+        self.server.kv.apply_replicate_set(key, value)
+        self._send_json(200, {"ok": True})
+
+    def _handle_replicate_delete(self, parsed) -> None:
+        body = self._parse_body()
+        key = body.get("key")
+        if key is None:
+            self._send_json(400, {"error": "missing key"})
+            return
+        self.server.kv.apply_replicate_delete(key)
+        self._send_json(200, {"ok": True})
+
+    def _handle_replicate_bulk_set(self, parsed) -> None:
+        body = self._parse_body()
+        items = body.get("items", [])
+        try:
+            pairs = [tuple(x) for x in items]
+        except (TypeError, ValueError):
+            self._send_json(400, {"error": "invalid items"})
+            return
+        self.server.kv.apply_replicate_bulk_set(pairs)
+        self._send_json(200, {"ok": True})
+
+    def _handle_replicate_batch(self, parsed) -> None:
+        body = self._parse_body()
+        ops = body.get("ops", [])
+        if not isinstance(ops, list) or not all(isinstance(op, list) and op for op in ops):
+            self._send_json(400, {"error": "invalid ops"})
+            return
+        try:
+            self.server.kv.apply_replicate_batch(ops)
+        except (TypeError, ValueError, IndexError):
+            self._send_json(400, {"error": "invalid ops"})
+            return
+        self._send_json(200, {"ok": True})
+
+    def _handle_promote_to_primary(self, parsed) -> None:
+        self._read_body()
+        self.server.kv.promote_to_primary()
+        self._send_json(200, {"ok": True, "role": "primary"})
+
+    def _handle_debug_reset(self, parsed) -> None:
+        self._read_body()
+        self.server.kv.reset()
+        self._send_json(200, {"ok": True})
+
+    # path -> handler; each handler reads the request body itself (or drains it)
+    _GET = {
+        "/get": _handle_get,
+        "/status": _handle_status,
+        "/primary/wait": _handle_primary_wait,
+    }
+    _POST = {
+        "/set": _handle_set,
+        "/delete": _handle_delete,
+        "/bulk_set": _handle_bulk_set,
+        "/bulk_set_ndjson": _handle_bulk_set_ndjson,
+        "/replicate/set": _handle_replicate_set,
+        "/replicate/delete": _handle_replicate_delete,
+        "/replicate/bulk_set": _handle_replicate_bulk_set,
+        "/replicate/batch": _handle_replicate_batch,
+        "/promote_to_primary": _handle_promote_to_primary,
+    }
+    if _DEBUG_RESET_ENABLED:
+        _POST["/_debug/reset"] = _handle_debug_reset
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        handler = self._GET.get(parsed.path)
+        if handler is None:
             self._send_json(404, {"error": "not found"})
+            return
+        handler(self, parsed)
+
+    def do_POST(self) -> None:
+        parsed = urlparse(self.path)
+        handler = self._POST.get(parsed.path)
+        if handler is None:
+            self._read_body()  # keep the persistent connection in sync
+            self._send_json(404, {"error": "not found"})
+            return
+        handler(self, parsed)
 
     def log_message(self, format, *args):
         pass
 
 
-class ClusterKVHTTPServer(HTTPServer):
+class ClusterKVHTTPServer(UnixServerMixin, ThreadingHTTPServer):
+    """One thread per request; the store's own locks serialize writes."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
     def __init__(self, server_address, data_dir: str, role: str, peer_urls: list[str]):
         super().__init__(server_address, ClusterKVHandler)
         self.kv = ReplicatedKVStore(data_dir=data_dir, role=role, peer_urls=peer_urls)
@@ -138,7 +260,8 @@ class ClusterKVHTTPServer(HTTPServer):
 
 
 def run_cluster_node(host: str, port: int, data_dir: str, role: str, peer_urls: list[str]) -> None:
-    server = ClusterKVHTTPServer((host, port), data_dir, role, peer_urls)
+    address = host if unix_path(host) else (host, port)  # "unix:/path/to.sock" -> Unix domain socket
+    server = ClusterKVHTTPServer(address, data_dir, role, peer_urls)
     try:
         server.serve_forever()
     except KeyboardInterrupt:
@@ -150,11 +273,11 @@ def run_cluster_node(host: str, port: int, data_dir: str, role: str, peer_urls:
 if __name__ == "__main__":
     import argparse
     p = argparse.ArgumentParser()
-    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--host", default="127.0.0.1", help='Bind address, or "unix:/path/to.sock"')
     p.add_argument("--port", type=int, required=True)
     p.add_argument("--data-dir", default="data")
     p.add_argument("--role", choices=["primary", "secondary"], required=True)
-    p.add_argument("--peers", default="", help="Comma-separated secondary URLs for primary")
+    p.add_argument("--peers", default="", help="Comma-separated secondary URLs (http://... or unix:/path) for primary")
     args = p.parse_args()
     peer_urls = [u.strip() for u in args.peers.split(",") if u.strip()]
     run_cluster_node(args.host, args.port, args.data_dir, args.role, peer_urls)
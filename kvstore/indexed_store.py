@@ -2,6 +2,8 @@
 KVStore wrapper that maintains full-text and embedding indexes on values.
 """
 
+import queue
+import threading
 from typing import Any, Optional
 
 from .store import KVStore
@@ -9,32 +11,76 @@ from .indexes import IndexedStore
 
 
 class KVStoreWithIndex(KVStore):
-    """KVStore that keeps full-text and embedding indexes on values."""
+    """
+    KVStore that keeps full-text and embedding indexes on values.
+    Index updates are applied by a background thread, so writes return as soon as the WAL is durable;
+    searches may briefly lag the latest writes (flush_index() waits for them to catch up).
+    """
 
     def __init__(self, data_dir: str = "data", wal_filename: str = "wal.log", enable_embedding: bool = True):
         super().__init__(data_dir=data_dir, wal_filename=wal_filename)
+        self._enable_embedding = enable_embedding
         self._index = IndexedStore(enable_embedding=enable_embedding)
-        # Index existing data from replay
-        for k, v in list(self._store.items()):
-            self._index.index_value(k, v)
+        # Index existing data from replay (one vectorizer fit for the whole corpus)
+        self._index.bulk_index(self._store.items())
+        self._index_q: queue.SimpleQueue = queue.SimpleQueue()
+        self._index_thread = threading.Thread(target=self._index_worker, name="kv-index", daemon=True)
+        self._index_thread.start()
+
+    def _index_worker(self) -> None:
+        """Apply queued index updates in write order."""
+        while True:
+            op = self._index_q.get()
+            kind = op[0]
+            if kind == "stop":
+                return
+            try:
+                if kind == "set":
+                    self._index.index_value(op[1], op[2])
+                elif kind == "del":
+                    self._index.remove_key(op[1])
+                elif kind == "bulk":
+                    self._index.bulk_index(op[1])  # one refit (or one transform) per batch
+                elif kind == "reset":
+                    self._index = IndexedStore(enable_embedding=self._enable_embedding)
+                elif kind == "flush":
+                    op[1].set()
+            except Exception:
+                pass  # A bad value must not stop indexing of later writes
+
+    def flush_index(self, timeout: Optional[float] = None) -> bool:
+        """Block until all index updates queued so far are applied. Returns False on timeout."""
+        done = threading.Event()
+        self._index_q.put(("flush", done))
+        return done.wait(timeout)
 
     def set(self, key: str, value: Any, *, debug_flaky: float = 0.0) -> None:
         super().set(key, value, debug_flaky=debug_flaky)
         if key in self._store:  # was applied (skip if debug_flaky skipped apply)
-            self._index.index_value(key, value)
+            self._index_q.put(("set", key, value))
 
     def delete(self, key: str, *, debug_flaky: float = 0.0) -> None:
         super().delete(key, debug_flaky=debug_flaky)
-        self._index.remove_key(key)
+        self._index_q.put(("del", key))
 
     def bulk_set(self, items: list[tuple[str, Any]], *, debug_flaky: float = 0.0) -> None:
         super().bulk_set(items, debug_flaky=debug_flaky)
-        for k, v in items:
-            if k in self._store:
-                self._index.index_value(k, v)
+        applied = [(k, v) for k, v in items if k in self._store]
+        if applied:
+            self._index_q.put(("bulk", applied))
+
+    def reset(self) -> None:
+        super().reset()
+        self._index_q.put(("reset",))
 
     def fulltext_search(self, query: str) -> list[str]:
         return self._index.fulltext_search(query)
 
     def embedding_search(self, query: str, top_k: int = 10) -> list[tuple[str, float]]:
         return self._index.embedding_search(query, top_k=top_k)
+
+    def close(self) -> None:
+        if self._index_thread.is_alive():
+            self._index_q.put(("stop",))
+            self._index_thread.join(timeout=5)
+        super().close()
@@ -4,74 +4,121 @@ Indexes on values: full-text search and word-embedding (vector) search.
 
 import re
 import threading
-from typing import Any, Optional
+from typing import Any, Iterable
 
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
     import numpy as np
+    import scipy.sparse as sp
     _HAS_SKLEARN = True
 except ImportError:
     _HAS_SKLEARN = False
 
 
+_TOKEN_PATTERN = r"[a-z0-9]+"
+_TOKEN_RE = re.compile(_TOKEN_PATTERN)
+
+
 def _tokenize(text: str) -> list[str]:
     """Simple tokenization: lowercase, alphanumeric tokens."""
-    text = str(text).lower()
-    return re.findall(r"[a-z0-9]+", text)
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+_NUM_SHARDS = 32  # power of two, so shard = hash(x) & (_NUM_SHARDS - 1)
 
 
 class FullTextIndex:
-    """Inverted index: word -> set of keys containing that word."""
+    """
+    Inverted index: word -> set of keys containing that word.
+    Both maps are split into _NUM_SHARDS shards, each with its own lock, so writers and searches
+    touching different words don't serialize on one lock. A write holds its key's shard lock for
+    the whole update (so updates of the same key can't interleave) and takes word-shard locks
+    one at a time, in ascending shard order.
+    """
 
     def __init__(self):
-        self._word_to_keys: dict[str, set[str]] = {}
-        self._key_to_words: dict[str, set[str]] = {}
-        self._lock = threading.RLock()
+        self._mask = _NUM_SHARDS - 1
+        # word shards: (lock, word -> keys); key shards: (lock, key -> words)
+        self._word_shards: list[tuple[threading.Lock, dict[str, set[str]]]] = [
+            (threading.Lock(), {}) for _ in range(_NUM_SHARDS)
+        ]
+        self._key_shards: list[tuple[threading.Lock, dict[str, set[str]]]] = [
+            (threading.Lock(), {}) for _ in range(_NUM_SHARDS)
+        ]
 
-    def index_value(self, key: str, value: Any) -> None:
-        words = set(_tokenize(str(value)))
-        with self._lock:
-            old_words = self._key_to_words.get(key)
-            if old_words:
-                for w in old_words:
-                    s = self._word_to_keys.get(w)
+    def _group_by_shard(self, words) -> dict[int, list[str]]:
+        groups: dict[int, list[str]] = {}
+        for w in words:
+            groups.setdefault(hash(w) & self._mask, []).append(w)
+        return groups
+
+    def _update_postings(self, key: str, removed, added) -> None:
+        """Remove key from `removed` words' postings and add it to `added` words' postings."""
+        by_shard: dict[int, tuple[list[str], list[str]]] = {}
+        for w in removed:
+            by_shard.setdefault(hash(w) & self._mask, ([], []))[0].append(w)
+        for w in added:
+            by_shard.setdefault(hash(w) & self._mask, ([], []))[1].append(w)
+        for i in sorted(by_shard):
+            rm, add = by_shard[i]
+            lock, word_to_keys = self._word_shards[i]
+            with lock:
+                for w in rm:
+                    s = word_to_keys.get(w)
                     if s:
                         s.discard(key)
                         if not s:
-                            self._word_to_keys.pop(w, None)
-            self._key_to_words[key] = words
-            for w in words:
-                self._word_to_keys.setdefault(w, set()).add(key)
+                            word_to_keys.pop(w, None)
+                for w in add:
+                    word_to_keys.setdefault(w, set()).add(key)
+
+    def index_value(self, key: str, value: Any) -> None:
+        words = set(_TOKEN_RE.findall(str(value).lower()))
+        lock, key_to_words = self._key_shards[hash(key) & self._mask]
+        with lock:
+            old_words = key_to_words.get(key) or set()
+            key_to_words[key] = words
+            self._update_postings(key, old_words - words, words - old_words)
 
     def remove_key(self, key: str) -> None:
-        with self._lock:
-            old_words = self._key_to_words.pop(key, set())
-            for w in old_words:
-                s = self._word_to_keys.get(w)
-                if s:
-                    s.discard(key)
-                    if not s:
-                        self._word_to_keys.pop(w, None)
+        lock, key_to_words = self._key_shards[hash(key) & self._mask]
+        with lock:
+            old_words = key_to_words.pop(key, set())
+            self._update_postings(key, old_words, ())
 
     def search(self, query: str) -> list[str]:
         """Return keys whose value contains all query words (AND)."""
         words = set(_tokenize(query))
         if not words:
             return []
-        with self._lock:
-            sets = [self._word_to_keys.get(w, set()) for w in words]
-            if not sets:
+        partial: list[set[str]] = []
+        for i, shard_words in sorted(self._group_by_shard(words).items()):
+            lock, word_to_keys = self._word_shards[i]
+            with lock:
+                sets = [word_to_keys.get(w) for w in shard_words]
+                if not all(sets):
+                    return []
+                # Smallest posting list first: set.intersection then only walks that many keys.
+                # It also builds a new set, so nothing shared escapes the lock.
+                sets.sort(key=len)
+                found = set.intersection(*sets)
+            if not found:
                 return []
-            result = sets[0].copy()
-            for s in sets[1:]:
-                result &= s
-            return list(result)
+            partial.append(found)
+        partial.sort(key=len)
+        return list(set.intersection(*partial))
+
+
+# The TF-IDF vocabulary is refit on every write until the corpus reaches this many documents;
+# after that it is frozen and each write only transforms its own document.
+_REFIT_LIMIT = 1000
 
 
 class IndexedStore:
     """
     Maintains full-text and TF-IDF embedding index over (key, value).
     Full-text: inverted index. Embedding: TF-IDF vectors, search by cosine similarity.
+    Vectors are kept sparse, one row per key; the search matrix is assembled lazily after writes.
     """
 
     def __init__(self, enable_embedding: bool = True):
@@ -79,9 +126,74 @@ class IndexedStore:
         self._key_to_value: dict[str, Any] = {}
         self._lock = threading.RLock()
         self._enable_embedding = enable_embedding and _HAS_SKLEARN
-        self._vectorizer = TfidfVectorizer(max_features=1000, tokenizer=_tokenize, token_pattern=None) if self._enable_embedding else None
-        self._vectors = None  # np array (n, dim)
+        # Same tokens as _tokenize, but through sklearn's own regex path instead of a Python callback.
+        # float32 halves the bytes a search scans compared to the float64 default.
+        self._vectorizer = TfidfVectorizer(
+            max_features=1000, lowercase=True, token_pattern=_TOKEN_PATTERN, dtype=np.float32
+        ) if self._enable_embedding else None
+        self._fitted = False  # vectorizer has a vocabulary
+        self._frozen = False  # vocabulary no longer refit on writes
         self._keys_order: list[str] = []
+        self._row_for_key: dict[str, int] = {}
+        self._rows: list[tuple] = []  # per key: (column indices, values) of its sparse TF-IDF row
+        self._row_norms: list[float] = []  # L2 norm of each row, updated with the row
+        self._vectors = None  # csr_matrix (n, dim) built from _rows; None when stale
+
+    def _sparse_rows(self, m) -> list[tuple]:
+        m = m.tocsr()
+        return [
+            (m.indices[m.indptr[i]:m.indptr[i + 1]], m.data[m.indptr[i]:m.indptr[i + 1]])
+            for i in range(m.shape[0])
+        ]
+
+    def _refit(self) -> None:
+        """Refit vocabulary and IDF on the whole corpus and recompute every row."""
+        docs = [str(self._key_to_value[k]) for k in self._keys_order]
+        self._vectors = None
+        if not docs:
+            self._rows = []
+            self._row_norms = []
+            return
+        try:
+            m = self._vectorizer.fit_transform(docs)
+        except Exception:
+            self._fitted = False
+            self._rows = [None] * len(docs)
+            self._row_norms = [0.0] * len(docs)
+            return
+        self._fitted = True
+        self._frozen = len(docs) >= _REFIT_LIMIT
+        self._rows = self._sparse_rows(m)
+        self._row_norms = [float(np.sqrt(np.dot(d, d))) for _, d in self._rows]
+
+    def _add_row(self, key: str) -> None:
+        """Reserve a row for key if it doesn't have one yet."""
+        if key not in self._row_for_key:
+            self._row_for_key[key] = len(self._keys_order)
+            self._keys_order.append(key)
+            self._rows.append(None)
+            self._row_norms.append(0.0)
+
+    def _set_row(self, key: str, text: str) -> None:
+        self._add_row(key)
+        if not self._frozen:
+            self._refit()
+            return
+        i = self._row_for_key[key]
+        self._rows[i] = row = self._sparse_rows(self._vectorizer.transform([text]))[0]
+        self._row_norms[i] = float(np.sqrt(np.dot(row[1], row[1])))
+        self._vectors = None
+
+    def _matrix(self):
+        """Return the (n, dim) search matrix, rebuilding it from _rows if stale."""
+        if self._vectors is None:
+            indptr = np.zeros(len(self._rows) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(idx) for idx, _ in self._rows])
+            indices = np.concatenate([idx for idx, _ in self._rows])
+            data = np.concatenate([d for _, d in self._rows])
+            dim = len(self._vectorizer.vocabulary_)
+            self._vectors = sp.csr_matrix((data, indices, indptr), shape=(len(self._rows), dim))
+        return self._vectors
 
     def index_value(self, key: str, value: Any) -> None:
         text = str(value)
@@ -89,46 +201,73 @@ class IndexedStore:
             self._key_to_value[key] = value
             self._ft.index_value(key, value)
             if self._enable_embedding and self._vectorizer is not None:
-                self._keys_order = list(self._key_to_value.keys())
-                docs = [str(self._key_to_value[k]) for k in self._keys_order]
-                try:
-                    self._vectorizer.fit(docs)
-                    self._vectors = self._vectorizer.transform(docs).toarray()
-                except Exception:
-                    self._vectors = None
+                self._set_row(key, text)
+
+    def bulk_index(self, items: Iterable[tuple[str, Any]]) -> None:
+        """
+        Index many (key, value) pairs with one embedding update for the whole batch: a single refit
+        while the vocabulary still refits, else a single transform of the batch's documents.
+        """
+        with self._lock:
+            batch: dict[str, Any] = {}
+            for key, value in items:
+                self._key_to_value[key] = value
+                self._ft.index_value(key, value)
+                batch[key] = value
+                if self._enable_embedding:
+                    self._add_row(key)
+            if not (batch and self._enable_embedding and self._vectorizer is not None):
+                return
+            if not self._frozen:
+                self._refit()
+                return
+            keys = list(batch)
+            rows = self._sparse_rows(self._vectorizer.transform([str(batch[k]) for k in keys]))
+            for key, row in zip(keys, rows):
+                i = self._row_for_key[key]
+                self._rows[i] = row
+                self._row_norms[i] = float(np.sqrt(np.dot(row[1], row[1])))
+            self._vectors = None
 
     def remove_key(self, key: str) -> None:
         with self._lock:
             self._key_to_value.pop(key, None)
             self._ft.remove_key(key)
-            if self._enable_embedding:
-                self._keys_order = list(self._key_to_value.keys())
-                docs = [str(self._key_to_value[k]) for k in self._keys_order]
-                if docs:
-                    try:
-                        self._vectorizer.fit(docs)
-                        self._vectors = self._vectorizer.transform(docs).toarray()
-                    except Exception:
-                        self._vectors = None
-                else:
+            if self._enable_embedding and key in self._row_for_key:
+                # Swap-with-last: move the final row into the freed slot instead of shifting every row after it.
+                i = self._row_for_key.pop(key)
+                last_key = self._keys_order.pop()
+                last_row = self._rows.pop()
+                last_norm = self._row_norms.pop()
+                if last_key != key:
+                    self._keys_order[i] = last_key
+                    self._rows[i] = last_row
+                    self._row_norms[i] = last_norm
+                    self._row_for_key[last_key] = i
+                if self._frozen:
                     self._vectors = None
+                else:
+                    self._refit()
 
     def fulltext_search(self, query: str) -> list[str]:
         return self._ft.search(query)
 
     def embedding_search(self, query: str, top_k: int = 10) -> list[tuple[str, float]]:
         """Return (key, cosine_similarity) for values most similar to query text."""
-        if not self._enable_embedding or self._vectors is None or not self._keys_order:
+        if not self._enable_embedding or not self._fitted or not self._keys_order:
             return []
         with self._lock:
             try:
+                vectors = self._matrix()
                 q = self._vectorizer.transform([query])
-                qv = q.toarray().ravel()
-                scores = np.dot(self._vectors, qv)
-                norm_q = np.linalg.norm(qv) + 1e-9
-                norms = np.linalg.norm(self._vectors, axis=1) + 1e-9
-                scores = scores / (norms * norm_q)
-                top = np.argsort(scores)[::-1][:top_k]
+                scores = (vectors @ q.T).toarray().ravel()
+                norm_q = np.sqrt(q.multiply(q).sum()) + 1e-9
+                scores = scores / ((np.asarray(self._row_norms, dtype=np.float32) + 1e-9) * norm_q)
+                k = min(top_k, len(scores))
+                if k <= 0:
+                    return []
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
                 return [(self._keys_order[i], float(scores[i])) for i in top if scores[i] > 0]
             except Exception:
                 return []
@@ -4,19 +4,22 @@ No primary/secondary; no elections. Last-write-wins for conflicts.
 """
 
 import subprocess
-import time
 import os
 from typing import Optional
 
+from .cluster_runner import NodeProcess, _ready_or_stop, start_node_mp
+
 
 def run_masterless_cluster(
     base_port: int = 8770,
     data_dirs: Optional[list[str]] = None,
     host: str = "127.0.0.1",
+    env: Optional[dict[str, str]] = None,
 ) -> list[subprocess.Popen]:
     """
     Start 3 nodes; each runs as primary with the other two as peers (replication targets).
     So every node accepts writes and replicates to the other two. No single primary.
+    env adds variables (e.g. KV_DEBUG_RESET) to the nodes' environment.
     """
     root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     if data_dirs is None:
@@ -36,9 +39,30 @@ def run_masterless_cluster(
                 "--peers", peers,
             ],
             cwd=root,
+            env={**os.environ, **env} if env else None,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
         )
         procs.append(proc)
-    time.sleep(1.5)
+    _ready_or_stop(procs, urls)
+    return procs
+
+
+def run_masterless_cluster_mp(
+    base_port: int = 8770,
+    data_dirs: Optional[list[str]] = None,
+    host: str = "127.0.0.1",
+    env: Optional[dict[str, str]] = None,
+) -> list[NodeProcess]:
+    """Same cluster as run_masterless_cluster, with the nodes forked from a forkserver."""
+    if data_dirs is None:
+        import tempfile
+        data_dirs = [tempfile.mkdtemp(prefix="kv_masterless_") for _ in range(3)]
+    ports = [base_port, base_port + 1, base_port + 2]
+    urls = [f"http://{host}:{p}" for p in ports]
+    procs = [
+        start_node_mp(host, port, ddir, "primary", [u for j, u in enumerate(urls) if j != i], env)
+        for i, (port, ddir) in enumerate(zip(ports, data_dirs))
+    ]
+    _ready_or_stop(procs, urls)
     return procs
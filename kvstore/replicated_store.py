@@ -3,18 +3,82 @@ Replicated KV store: one primary, N secondaries.
 Primary replicates writes to secondaries. Secondary can be promoted to primary on failover.
 """
 
-import json
+import queue
 import threading
-import urllib.request
-import urllib.error
+import time
 from typing import Optional
 
-from .store import KVStore
+from ._json import dumps
+from ._unix import http_connection
+from .store import KVStore, _WalTicket
+
+# Outbound replication batching: a peer sender ships up to MAX_BATCH queued ops per request,
+# waiting at most MAX_DELAY_MS after the first op for more to arrive.
+MAX_BATCH = 256
+MAX_DELAY_MS = 2
+
+_BATCH_HEADERS = {"Content-Type": "application/json", "Connection": "keep-alive"}
+
+
+class _PeerSender:
+    """Background sender that ships queued ops to one peer as /replicate/batch requests."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        # Kept-alive connection to the peer (TCP, or AF_UNIX for "unix:/path" peers); only this
+        # sender's thread uses it, so no lock is needed.
+        self._conn = http_connection(self.url, timeout=5.0)
+        self._q: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"kv-replicate-{self.url}", daemon=True)
+        self._thread.start()
+
+    def put(self, op: bytes) -> None:
+        """Queue one op, already JSON-encoded."""
+        self._q.put(op)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Send whatever is still queued, then stop the thread."""
+        self._q.put(None)
+        self._thread.join(timeout=timeout)
+        self._conn.close()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            op = self._q.get()
+            if op is None:
+                return
+            batch = [op]
+            deadline = time.monotonic() + MAX_DELAY_MS / 1000.0
+            while len(batch) < MAX_BATCH:
+                try:
+                    op = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if op is None:
+                    stopping = True
+                    break
+                batch.append(op)
+            self._send(batch)
+
+    def _send(self, ops: list[bytes]) -> None:
+        body = b'{"ops":[' + b",".join(ops) + b"]}"
+        # A second attempt covers a kept-alive socket the peer has since closed; the batch is
+        # idempotent and nothing else is sent in between, so a repeat cannot reorder writes.
+        for _ in range(2):
+            try:
+                self._conn.request("POST", "/replicate/batch", body=body, headers=_BATCH_HEADERS)
+                self._conn.getresponse().read()
+                return
+            except Exception:
+                self._conn.close()  # reconnects on the next request
+        # Best-effort replication: give up on this batch
 
 
 class ReplicatedKVStore(KVStore):
     """
     KVStore that can run as primary (replicate to secondaries) or secondary (read-only, receives replication).
+    Replication is asynchronous: each write is queued per peer and shipped in small ordered batches.
     """
 
     def __init__(
@@ -27,39 +91,49 @@ class ReplicatedKVStore(KVStore):
         super().__init__(data_dir=data_dir, wal_filename=wal_filename)
         self._role = role  # "primary" | "secondary"
         self._peer_urls = peer_urls or []
+        self._senders = [_PeerSender(url) for url in self._peer_urls]
         self._lock_role = threading.RLock()
-
-    def _replicate_to_peers(self, path: str, body: Optional[dict] = None) -> None:
-        """Send the same write to all peer secondaries."""
-        for url in self._peer_urls:
-            try:
-                req = urllib.request.Request(
-                    url.rstrip("/") + path,
-                    data=json.dumps(body or {}).encode() if body else None,
-                    method="POST",
-                    headers={"Content-Type": "application/json"},
-                )
-                urllib.request.urlopen(req, timeout=5)
-            except Exception:
-                pass  # Best-effort replication
+        self._order_lock = threading.Lock()  # keeps replication in WAL order (see _log_write)
+        self._primary_event = threading.Event()  # set while primary; wakes wait_until_primary()
+        if role == "primary":
+            self._primary_event.set()
+
+    def _replicate(self, op: list) -> None:
+        """Queue a write for every peer secondary (encoded once, shared by all peers)."""
+        if not self._senders:
+            return
+        raw = dumps(op)
+        for sender in self._senders:
+            sender.put(raw)
+
+    def _log_write(self, data: bytes, op: list) -> None:
+        # Peers must see writes in local WAL order, so the WAL enqueue and the replication enqueue
+        # happen together under _order_lock; the fsync wait happens outside it, so concurrent
+        # writers still share one group commit.
+        with self._order_lock:
+            ticket = self._enqueue(_WalTicket(data))
+            self._replicate(op)  # bulk items may be tuples; they encode as JSON arrays
+        self._wait(ticket)
+
+    def _delete_is_noop(self, key: str) -> bool:
+        # A peer may hold a key this node does not (replication is async, and masterless nodes all
+        # take writes), so with peers every delete is logged and shipped.
+        return not self._senders and super()._delete_is_noop(key)
 
     def set(self, key, value, *, debug_flaky: float = 0.0) -> None:
         if self._role != "primary":
             raise RuntimeError("not primary")
         super().set(key, value, debug_flaky=debug_flaky)
-        self._replicate_to_peers("/replicate/set", {"key": key, "value": value})
 
     def delete(self, key, *, debug_flaky: float = 0.0) -> None:
         if self._role != "primary":
             raise RuntimeError("not primary")
         super().delete(key, debug_flaky=debug_flaky)
-        self._replicate_to_peers("/replicate/delete", {"key": key})
 
     def bulk_set(self, items, *, debug_flaky: float = 0.0) -> None:
         if self._role != "primary":
             raise RuntimeError("not primary")
         super().bulk_set(items, debug_flaky=debug_flaky)
-        self._replicate_to_peers("/replicate/bulk_set", {"items": [list(p) for p in items]})
 
     def apply_replicate_set(self, key: str, value) -> None:
         """Apply replicated SET (WAL + memory so replica is durable)."""
@@ -71,14 +145,23 @@ class ReplicatedKVStore(KVStore):
     def apply_replicate_bulk_set(self, items: list[tuple[str, any]]) -> None:
         self.replicate_apply_bulk_set(items)
 
+    def apply_replicate_batch(self, ops: list) -> None:
+        """Apply an ordered batch of replicated ops (one WAL fsync for the whole batch)."""
+        self.replicate_apply_batch(ops)
+
     def promote_to_primary(self) -> None:
         with self._lock_role:
             self._role = "primary"
+            self._primary_event.set()
 
     def demote_to_secondary(self, peer_urls: list[str]) -> None:
         with self._lock_role:
             self._role = "secondary"
+            self._primary_event.clear()
+            for sender in self._senders:
+                sender.stop()
             self._peer_urls = peer_urls
+            self._senders = [_PeerSender(url) for url in peer_urls]
 
     @property
     def role(self) -> str:
@@ -86,3 +169,13 @@ class ReplicatedKVStore(KVStore):
 
     def is_primary(self) -> bool:
         return self._role == "primary"
+
+    def wait_until_primary(self, timeout: Optional[float] = None) -> bool:
+        """Block until this node is primary (returns at once if it already is). False on timeout."""
+        return self._primary_event.wait(timeout)
+
+    def close(self) -> None:
+        for sender in self._senders:
+            sender.stop()
+        self._senders = []
+        super().close()
@@ -3,112 +3,217 @@ HTTP server for the key-value store (built on TCP).
 Runs on a single port; supports Set, Get, Delete, BulkSet, and optional indexes (full-text, embedding).
 """
 
-import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import os
+import socket
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
 from urllib.parse import urlparse, parse_qs
 from .store import KVStore
 from .indexed_store import KVStoreWithIndex
+from ._json import JSONDecodeError, dumps, iter_ndjson, loads
+from ._unix import UnixServerMixin, unix_path
+
+# debug_flaky is a test-only knob; unless KV_DEBUG_FLAKY=1 the request field is ignored entirely.
+_DEBUG_FLAKY_ENABLED = os.environ.get("KV_DEBUG_FLAKY") == "1"
+# POST /_debug/reset wipes the store so test suites can reuse one server; only routed when KV_DEBUG_RESET=1.
+_DEBUG_RESET_ENABLED = os.environ.get("KV_DEBUG_RESET") == "1"
+
+# Pre-encoded bodies for the constant replies, sent with _send_raw.
+_OK = b'{"ok":true}'
+_NOT_FOUND = b'{"error":"not found"}'
+_KEY_NOT_FOUND = b'{"found":false}'
+_MISSING_KEY = b'{"error":"missing key"}'
+_BAD_ITEMS = b'{"error":"items must be list of [key, value]"}'
+_BAD_NDJSON = b'{"error":"items must be NDJSON objects with k and v"}'
 
 
 class KVHandler(BaseHTTPRequestHandler):
     """HTTP request handler for KV API."""
 
-    def _parse_body(self) -> dict:
+    def _read_body(self) -> bytes:
         content_length = int(self.headers.get("Content-Length", 0))
         if content_length == 0:
+            return b""
+        return self.rfile.read(content_length)
+
+    def _parse_body(self) -> dict:
+        raw = self._read_body()
+        if not raw:
             return {}
-        raw = self.rfile.read(content_length)
         try:
-            return json.loads(raw.decode("utf-8"))
-        except json.JSONDecodeError:
+            return loads(raw)  # orjson parses the bytes directly
+        except JSONDecodeError:
             return {}
 
-    def _send_json(self, status: int, body: dict) -> None:
+    def _send_raw(self, status: int, data: bytes) -> None:
+        """Send an already-encoded JSON body."""
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
-        data = json.dumps(body).encode("utf-8")
         self.send_header("Content-Length", str(len(data)))
         self.end_headers()
         self.wfile.write(data)
 
-    def do_GET(self) -> None:
-        parsed = urlparse(self.path)
+    def _send_json(self, status: int, body: dict) -> None:
+        self._send_raw(status, dumps(body))
+
+    # --- GET handlers -------------------------------------------------------
+
+    def _handle_get(self, parsed) -> None:
+        qs = parse_qs(parsed.query)
+        key = qs.get("key", [None])[0]
+        if key is None:
+            self._send_raw(400, _MISSING_KEY)
+            return
+        value = self.server.kv.get(key)
+        if value is None:
+            self._send_raw(404, _KEY_NOT_FOUND)
+            return
+        self._send_json(200, {"found": True, "value": value})
+
+    def _handle_search(self, parsed) -> None:
+        if not hasattr(self.server.kv, "fulltext_search"):
+            self._send_raw(404, _NOT_FOUND)
+            return
+        q = parse_qs(parsed.query).get("q", [""])[0]
+        keys = self.server.kv.fulltext_search(q)
+        self._send_json(200, {"keys": keys})
+
+    def _handle_search_similar(self, parsed) -> None:
+        if not hasattr(self.server.kv, "embedding_search"):
+            self._send_raw(404, _NOT_FOUND)
+            return
         qs = parse_qs(parsed.query)
-        if parsed.path == "/get":
-            key = qs.get("key", [None])[0]
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
-            value = self.server.kv.get(key)
-            if value is None:
-                self._send_json(404, {"found": False})
-                return
-            self._send_json(200, {"found": True, "value": value})
-        elif parsed.path == "/search" and hasattr(self.server.kv, "fulltext_search"):
-            q = qs.get("q", [""])[0]
-            keys = self.server.kv.fulltext_search(q)
-            self._send_json(200, {"keys": keys})
-        elif parsed.path == "/search_similar" and hasattr(self.server.kv, "embedding_search"):
-            q = qs.get("q", [""])[0]
-            top_k = int(qs.get("top_k", [10])[0])
-            results = self.server.kv.embedding_search(q, top_k=top_k)
-            self._send_json(200, {"results": [{"key": k, "score": s} for k, s in results]})
-        elif parsed.path == "/shutdown":
-            self._send_json(200, {"ok": True})
-            self.server.shutdown()
+        q = qs.get("q", [""])[0]
+        top_k = int(qs.get("top_k", [10])[0])
+        results = self.server.kv.embedding_search(q, top_k=top_k)
+        self._send_json(200, {"results": [{"key": k, "score": s} for k, s in results]})
+
+    def _handle_shutdown(self, parsed) -> None:
+        self._send_raw(200, _OK)
+        self.server.shutdown()
+
+    # --- POST handlers ------------------------------------------------------
+
+    def _handle_set(self, parsed) -> None:
+        body = self._parse_body()
+        key = body.get("key")
+        value = body.get("value")
+        if key is None:
+            self._send_raw(400, _MISSING_KEY)
+            return
+        if _DEBUG_FLAKY_ENABLED:
+            self.server.kv.set(key, value, debug_flaky=float(body.get("debug_flaky", 0)))
         else:
-            self._send_json(404, {"error": "not found"})
+            self.server.kv.set(key, value)
+        self._send_raw(200, _OK)
 
-    def do_POST(self) -> None:
-        parsed = urlparse(self.path)
+    def _handle_delete(self, parsed) -> None:
         body = self._parse_body()
+        key = body.get("key")
+        if key is None:
+            self._send_raw(400, _MISSING_KEY)
+            return
+        if _DEBUG_FLAKY_ENABLED:
+            self.server.kv.delete(key, debug_flaky=float(body.get("debug_flaky", 0)))
+        else:
+            self.server.kv.delete(key)
+        self._send_raw(200, _OK)
 
-        if parsed.path == "/set":
-            key = body.get("key")
-            value = body.get("value")
-            debug_flaky = float(body.get("debug_flaky", 0))
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
-            self.server.kv.set(key, value, debug_flaky=debug_flaky)
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/delete":
-            key = body.get("key")
-            debug_flaky = float(body.get("debug_flaky", 0))
-            if key is None:
-                self._send_json(400, {"error": "missing key"})
-                return
-            self.server.kv.delete(key, debug_flaky=debug_flaky)
-            self._send_json(200, {"ok": True})
-
-        elif parsed.path == "/bulk_set":
-            items = body.get("items", [])
-            debug_flaky = float(body.get("debug_flaky", 0))
-            if not isinstance(items, list):
-                self._send_json(400, {"error": "items must be list of [key, value]"})
-                return
-            try:
-                pairs = [tuple(x) for x in items]
-            except (TypeError, ValueError):
-                self._send_json(400, {"error": "items must be list of [key, value]"})
-                return
-            self.server.kv.bulk_set(pairs, debug_flaky=debug_flaky)
-            self._send_json(200, {"ok": True})
+    def _handle_bulk_set(self, parsed) -> None:
+        body = self._parse_body()
+        items = body.get("items", [])
+        if not isinstance(items, list) or not all(isinstance(x, list) and len(x) == 2 for x in items):
+            self._send_raw(400, _BAD_ITEMS)
+            return
+        pairs = [(x[0], x[1]) for x in items]
+        if _DEBUG_FLAKY_ENABLED:
+            self.server.kv.bulk_set(pairs, debug_flaky=float(body.get("debug_flaky", 0)))
+        else:
+            self.server.kv.bulk_set(pairs)
+        self._send_raw(200, _OK)
 
+    def _handle_bulk_set_ndjson(self, parsed) -> None:
+        """Bulk set from an NDJSON body: one {"k": key, "v": value} object per line."""
+        raw = self._read_body()
+        try:
+            pairs = [(o["k"], o.get("v")) for o in iter_ndjson(raw)]
+        except (JSONDecodeError, KeyError, TypeError):
+            self._send_raw(400, _BAD_NDJSON)
+            return
+        if _DEBUG_FLAKY_ENABLED:
+            qs = parse_qs(parsed.query)
+            self.server.kv.bulk_set(pairs, debug_flaky=float(qs.get("debug_flaky", [0])[0]))
         else:
-            self._send_json(404, {"error": "not found"})
+            self.server.kv.bulk_set(pairs)
+        self._send_raw(200, _OK)
+
+    def _handle_debug_reset(self, parsed) -> None:
+        self._read_body()
+        self.server.kv.reset()
+        self._send_raw(200, _OK)
+
+    # path -> handler; each handler reads the request body itself
+    _GET = {
+        "/get": _handle_get,
+        "/search": _handle_search,
+        "/search_similar": _handle_search_similar,
+        "/shutdown": _handle_shutdown,
+    }
+    _POST = {
+        "/set": _handle_set,
+        "/delete": _handle_delete,
+        "/bulk_set": _handle_bulk_set,
+        "/bulk_set_ndjson": _handle_bulk_set_ndjson,
+    }
+    if _DEBUG_RESET_ENABLED:
+        _POST["/_debug/reset"] = _handle_debug_reset
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        handler = self._GET.get(parsed.path)
+        if handler is None:
+            self._send_raw(404, _NOT_FOUND)
+            return
+        handler(self, parsed)
+
+    def do_POST(self) -> None:
+        parsed = urlparse(self.path)
+        handler = self._POST.get(parsed.path)
+        if handler is None:
+            self._read_body()
+            self._send_raw(404, _NOT_FOUND)
+            return
+        handler(self, parsed)
 
     def log_message(self, format, *args):
         """Reduce log noise in tests."""
         pass
 
 
-class KVHTTPServer(HTTPServer):
-    """HTTPServer that holds the KV store."""
+class KVHTTPServer(UnixServerMixin, ThreadingHTTPServer):
+    """HTTP server that holds the KV store. One thread per request; the store's own locks serialize writes."""
+
+    daemon_threads = True
+    allow_reuse_address = True
 
-    def __init__(self, server_address, data_dir: str = "data", use_index: bool = False):
-        super().__init__(server_address, KVHandler)
+    def __init__(
+        self,
+        server_address,
+        data_dir: str = "data",
+        use_index: bool = False,
+        listen_fd: Optional[int] = None,
+    ):
+        """listen_fd: serve on an inherited, already listening socket (server_address is then ignored)."""
+        if listen_fd is None:
+            super().__init__(server_address, KVHandler)
+        else:
+            super().__init__(("", 0), KVHandler, bind_and_activate=False)
+            self.socket.close()
+            self.socket = socket.socket(fileno=listen_fd)  # family and type come from the fd
+            self.address_family = self.socket.family
+            self.server_address = self.socket.getsockname()
+            self.server_name = "localhost"
+            self.server_port = self.server_address[1] if isinstance(self.server_address, tuple) else 0
         self.kv = KVStoreWithIndex(data_dir=data_dir) if use_index else KVStore(data_dir=data_dir)
         self._data_dir = data_dir
 
@@ -117,9 +222,19 @@ class KVHTTPServer(HTTPServer):
         super().server_close()
 
 
-def run_server(host: str = "127.0.0.1", port: int = 8765, data_dir: str = "data", use_index: bool = False) -> None:
-    """Run the KV HTTP server (blocking)."""
-    server = KVHTTPServer((host, port), data_dir=data_dir, use_index=use_index)
+def run_server(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    data_dir: str = "data",
+    use_index: bool = False,
+    listen_fd: Optional[int] = None,
+) -> None:
+    """
+    Run the KV HTTP server (blocking). host "unix:/path/to.sock" serves on a Unix domain socket instead;
+    listen_fd serves on a listening socket inherited from the parent process (host and port are ignored).
+    """
+    address = host if unix_path(host) else (host, port)
+    server = KVHTTPServer(address, data_dir=data_dir, use_index=use_index, listen_fd=listen_fd)
     try:
         server.serve_forever()
     except KeyboardInterrupt:
@@ -131,9 +246,10 @@ def run_server(host: str = "127.0.0.1", port: int = 8765, data_dir: str = "data"
 if __name__ == "__main__":
     import argparse
     p = argparse.ArgumentParser()
-    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--host", default="127.0.0.1", help='Bind address, or "unix:/path/to.sock"')
     p.add_argument("--port", type=int, default=8765)
     p.add_argument("--data-dir", default="data")
     p.add_argument("--index", action="store_true", help="Enable full-text and embedding indexes")
+    p.add_argument("--fd", type=int, default=None, help="Serve on this inherited listening socket fd")
     args = p.parse_args()
-    run_server(host=args.host, port=args.port, data_dir=args.data_dir, use_index=args.index)
+    run_server(host=args.host, port=args.port, data_dir=args.data_dir, use_index=args.index, listen_fd=args.fd)
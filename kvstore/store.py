@@ -4,86 +4,372 @@ Optimized for 100% durability: every write is fsync'd to WAL before applying.
 """
 
 import os
-import json
 import base64
+import hashlib
+import json
+import queue
 import random
 import threading
 from pathlib import Path
 from typing import Any, Optional
 
+from ._json import JSONDecodeError, dumps, loads
+
+
+# First line of a v2 WAL. v2 lines hold plain JSON fields separated by tabs:
+#   SET\t<json key>\t<json value> | DEL\t<json key> | BULK_SET\t<json list of [key, value]>
+# JSON escapes tabs and newlines inside strings, so no further quoting is needed.
+# A WAL without this header is legacy v1 (raw keys, base64-wrapped JSON) and is migrated on open.
+_WAL_HEADER = b'{"v":2}\n'
+
+
+def _set_record(key: str, value: Any) -> bytes:
+    """SET record (compact JSON never contains a tab or newline)."""
+    return b"SET\t" + dumps(key) + b"\t" + dumps(value) + b"\n"
+
+
+def _del_record(key: str) -> bytes:
+    return b"DEL\t" + dumps(key) + b"\n"
+
+
+def _bulk_record(items) -> bytes:
+    """BULK_SET record for a sequence of (key, value) pairs (tuples encode as arrays)."""
+    return b"BULK_SET\t" + dumps(items) + b"\n"
+
+
+# The WAL writer thread fsyncs up to this many queued records (or bytes) at once.
+_WAL_BATCH_MAX = 256
+_WAL_BATCH_BYTES = 64 * 1024
+
+
+class _WalTicket:
+    """
+    One queued WAL record (or a checkpoint or reset request). The writer thread sets error (if the
+    write, checkpoint or reset failed) and then done.
+    """
+
+    __slots__ = ("data", "checkpoint", "reset", "done", "error")
 
-def _encode_value(v: Any) -> str:
-    """Encode value for WAL (JSON + base64 for binary safety)."""
-    return base64.b64encode(json.dumps(v).encode()).decode()
+    def __init__(self, data: bytes, checkpoint: bool = False, reset: bool = False):
+        self.data = data
+        self.checkpoint = checkpoint
+        self.reset = reset
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
 
 
-def _decode_value(s: str) -> Any:
-    """Decode value from WAL."""
-    return json.loads(base64.b64decode(s.encode()).decode())
+def _write_all(fd: int, data: bytes) -> None:
+    """os.write until every byte is out (short writes are rare on regular files, but allowed)."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _writev_all(fd: int, chunks: list[bytes]) -> None:
+    """Scatter-gather write of chunks with os.writev (single joined write where it is unavailable)."""
+    if not hasattr(os, "writev"):  # Windows
+        _write_all(fd, b"".join(chunks))
+        return
+    n = os.writev(fd, chunks)
+    if n < sum(map(len, chunks)):
+        _write_all(fd, b"".join(chunks)[n:])
+
+
+def _last_record_end(path, size: int, block: int = 64 * 1024) -> int:
+    """Offset just past the last newline in the first size bytes of path (0 if there is none)."""
+    with open(path, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            i = f.read(end - start).rfind(b"\n")
+            if i >= 0:
+                return start + i + 1
+            end = start
+    return 0
+
+
+def _decode_key_v1(b: bytes) -> str:
+    """Legacy v1 keys are raw UTF-8."""
+    return b.decode("utf-8")
+
+
+def _decode_value_v1(s: bytes) -> Any:
+    """Decode a base64-wrapped value from a legacy v1 WAL."""
+    return loads(base64.b64decode(s))
+
+
+def _replay_into(store: dict, raw: bytes) -> bool:
+    """
+    Apply the WAL records in raw to store. Returns True if raw is a legacy v1 WAL.
+    The blob is split once; records dispatch through a small table.
+    """
+    lines = raw.split(b"\n")
+    if not raw.endswith(b"\n"):
+        lines.pop()  # torn tail: a crash mid-append; that record was never acknowledged
+    if not lines or not lines[0]:
+        return False
+    legacy = lines[0] != _WAL_HEADER[:-1]
+    if legacy:
+        decode_key, decode_value = _decode_key_v1, _decode_value_v1
+    else:
+        lines[0] = b""
+        decode_key = decode_value = loads
+    store_set = store.__setitem__
+    store_pop = store.pop
+    store_update = store.update
+
+    def replay_set(parts):
+        if len(parts) == 3:
+            store_set(decode_key(parts[1]), decode_value(parts[2]))
+
+    def replay_del(parts):
+        store_pop(decode_key(parts[1]), None)
+
+    def replay_bulk(parts):
+        if len(parts) == 2:
+            # Atomic bulk: list of [key, value] pairs, applied by dict.update in C
+            store_update(decode_value(parts[1]))
+
+    handlers = {
+        b"SET": replay_set,
+        b"DEL": replay_del,
+        b"BULK_SET": replay_bulk,
+        b"BULK_SET_LEGACY": replay_set,
+    }
+    for line in lines:
+        if not line:
+            continue
+        parts = line.split(b"\t", 2)
+        handler = handlers.get(parts[0])
+        if handler is None or len(parts) < 2:
+            continue
+        try:
+            handler(parts)
+        except (JSONDecodeError, ValueError, TypeError):
+            pass  # torn or corrupt record: it was never acknowledged
+    return legacy
 
 
 class KVStore:
     """
     In-memory KV store with persistent WAL.
     WAL is always written and fsync'd before in-memory apply (except when debug_flaky skips apply).
+    Once the WAL grows past checkpoint_bytes it is folded into snapshot.json and truncated,
+    so startup replays the snapshot plus a short WAL tail instead of the whole history.
     """
 
+    checkpoint_bytes: Optional[int] = 64 * 1024 * 1024  # None or 0: only explicit checkpoint()
+
     def __init__(self, data_dir: str = "data", wal_filename: str = "wal.log"):
         self._data_dir = Path(data_dir)
         self._data_dir.mkdir(parents=True, exist_ok=True)
         self._wal_path = self._data_dir / wal_filename
+        self._snapshot_path = self._data_dir / "snapshot.json"
         self._store: dict[str, Any] = {}
         self._lock = threading.RLock()
-        self._wal_file = None
+        self._wal_fd: Optional[int] = None
+        # Records go through a queue to one writer thread, which shares each fsync across everything queued.
+        self._wal_q: queue.SimpleQueue = queue.SimpleQueue()
+        self._wal_thread: Optional[threading.Thread] = None
+        self._wal_size = 0  # WAL bytes since the last checkpoint (owned by the writer thread)
+        self._flaky_skipped = False  # a debug_flaky skip may have left the WAL ahead of memory
+        if self._replay_wal():
+            self._migrate_wal()
         self._open_wal()
-        self._replay_wal()
 
     def _open_wal(self) -> None:
-        """Open WAL in append mode."""
-        self._wal_file = open(self._wal_path, "a", encoding="utf-8")
+        """Open WAL as a raw append-only fd (no text codec or userspace buffer), writing the v2 header if new."""
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        self._wal_fd = os.open(self._wal_path, flags, 0o644)
+        size = os.fstat(self._wal_fd).st_size
+        end = _last_record_end(self._wal_path, size) if size else 0
+        if end < size:
+            # Cut a torn tail off before appending, or the next record would be glued onto it.
+            os.ftruncate(self._wal_fd, end)
+            os.fsync(self._wal_fd)
+        self._wal_size = end
+        self._wal_thread = threading.Thread(target=self._wal_writer, name="kv-wal-writer", daemon=True)
+        self._wal_thread.start()
+        if os.fstat(self._wal_fd).st_size == 0:
+            self._wal_append_sync(_WAL_HEADER)
 
-    def _wal_append_sync(self, line: str) -> None:
-        """Append line to WAL and fsync (synchronous, for durability)."""
+    def _fsync_dir(self) -> None:
+        """fsync the data directory so a rename inside it is durable."""
+        dir_fd = os.open(self._data_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _write_snapshot(self, state: dict) -> None:
+        """Atomically replace snapshot.json with state (write tmp, fsync, rename)."""
+        tmp_path = self._snapshot_path.with_name(self._snapshot_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+        self._fsync_dir()
+
+    def _migrate_wal(self) -> None:
+        """Move a legacy v1 WAL's replayed state into snapshot.json and restart the WAL as v2."""
+        self._write_snapshot(self._store)
+        tmp_path = self._wal_path.with_name(self._wal_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_WAL_HEADER)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._wal_path)
+        self._fsync_dir()
+
+    def _checkpoint_now(self) -> None:
+        """
+        Fold the WAL into snapshot.json, then truncate the WAL to its header. Runs on the WAL writer
+        thread, so no record lands in between. The state is rebuilt from the files rather than taken
+        from memory, which keeps records whose apply is still in flight or was skipped (debug_flaky).
+        If we crash before the truncate, replay applies the same tail on top of the snapshot: harmless.
+        """
+        state = loads(self._snapshot_path.read_bytes()) if self._snapshot_path.exists() else {}
+        _replay_into(state, self._wal_path.read_bytes())
+        self._write_snapshot(state)
+        os.ftruncate(self._wal_fd, 0)
+        _write_all(self._wal_fd, _WAL_HEADER)
+        os.fsync(self._wal_fd)
+        self._wal_size = 0
+
+    def checkpoint(self) -> None:
+        """Fold everything logged so far into snapshot.json and truncate the WAL."""
+        self._submit(_WalTicket(b"", checkpoint=True))
+
+    def _reset_now(self) -> None:
+        """Drop snapshot.json and truncate the WAL to its header. Runs on the WAL writer thread."""
+        if self._snapshot_path.exists():
+            os.unlink(self._snapshot_path)
+            self._fsync_dir()
+        os.ftruncate(self._wal_fd, 0)
+        _write_all(self._wal_fd, _WAL_HEADER)
+        os.fsync(self._wal_fd)
+        self._wal_size = 0
+
+    def reset(self) -> None:
+        """
+        Erase all data, on disk and in memory, without reopening the store. Meant for test
+        harnesses reusing one server across tests. Writes queued after the reset are logged after
+        it and kept. A write logged just before it whose in-memory apply is still in flight may
+        land in memory after the clear, until the next restart.
+        """
         with self._lock:
-            self._wal_file.write(line + "\n")
-            self._wal_file.flush()
-            os.fsync(self._wal_file.fileno())
+            self._submit(_WalTicket(b"", reset=True))
+            self._store.clear()
+            self._flaky_skipped = False
+
+    def _wal_append_sync(self, data: bytes) -> None:
+        """
+        Append encoded record(s), each ending in a newline, to WAL and return once fsync'd (synchronous,
+        for durability). Callers encode before calling; the WAL writer thread only writes and fsyncs,
+        sharing each fsync across concurrent callers.
+        """
+        self._submit(_WalTicket(data))
+
+    def _submit(self, ticket: _WalTicket) -> None:
+        """Queue a ticket for the WAL writer thread and wait for it."""
+        self._wait(self._enqueue(ticket))
+
+    def _enqueue(self, ticket: _WalTicket) -> _WalTicket:
+        """Queue a ticket for the WAL writer thread without waiting; records are written in queue order."""
+        if self._wal_thread is None:
+            raise ValueError("WAL is closed")
+        self._wal_q.put(ticket)
+        return ticket
+
+    def _wait(self, ticket: _WalTicket) -> None:
+        """Block until the writer thread has handled ticket; re-raise its error, if any."""
+        ticket.done.wait()
+        if ticket.error is not None:
+            raise ticket.error
+
+    def _log_write(self, data: bytes, op: list) -> None:
+        """
+        Log a client write (set/delete/bulk_set) and return once it is fsync'd. op is the write as
+        ["set", key, value], ["del", key] or ["bulk", items], for subclasses that ship it elsewhere.
+        """
+        self._wal_append_sync(data)
+
+    def _wal_writer(self) -> None:
+        """Drain queued records, write them with one writev + one fsync, then release every waiter."""
+        q = self._wal_q
+        fd = self._wal_fd
+        stopping = False
+        while not stopping:
+            ticket = q.get()
+            if ticket is None:
+                return
+            batch = [ticket]
+            size = len(ticket.data)
+            # A checkpoint or reset ends the batch: records queued after it go into the next batch,
+            # so they are written after it runs (a reset must not truncate them away).
+            while len(batch) < _WAL_BATCH_MAX and size < _WAL_BATCH_BYTES:
+                if ticket.checkpoint or ticket.reset:
+                    break
+                try:
+                    ticket = q.get_nowait()
+                except queue.Empty:
+                    break
+                if ticket is None:
+                    stopping = True
+                    break
+                batch.append(ticket)
+                size += len(ticket.data)
+            error = admin_error = None
+            try:
+                chunks = [t.data for t in batch if t.data]
+                if chunks:
+                    _writev_all(fd, chunks)
+                    os.fsync(fd)
+            except OSError as e:
+                error = e
+            self._wal_size += size
+            limit = self.checkpoint_bytes
+            try:
+                if error is None and any(t.reset for t in batch):
+                    self._reset_now()
+                elif error is None and (any(t.checkpoint for t in batch) or (limit and self._wal_size >= limit)):
+                    self._checkpoint_now()
+            except Exception as e:
+                admin_error = e  # the records are durable either way; only checkpoint()/reset() callers see it
+            for t in batch:
+                t.error = error or (admin_error if t.checkpoint or t.reset else None)
+                t.done.set()
 
-    def _replay_wal(self) -> None:
-        """Replay WAL to rebuild in-memory state."""
+    def _replay_wal(self) -> bool:
+        """Rebuild in-memory state from snapshot.json plus the WAL. Returns True if the WAL is legacy v1."""
+        if self._snapshot_path.exists():
+            self._store.update(loads(self._snapshot_path.read_bytes()))
         if not self._wal_path.exists():
-            return
-        with open(self._wal_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.rstrip("\n")
-                if not line:
-                    continue
-                parts = line.split("\t", 2)
-                if len(parts) < 2:
-                    continue
-                op, rest = parts[0], parts[1:]
-                if op == "SET":
-                    if len(rest) == 2:
-                        self._store[rest[0]] = _decode_value(rest[1])
-                elif op == "DEL":
-                    self._store.pop(rest[0], None)
-                elif op == "BULK_SET":
-                    if len(rest) == 1:
-                        # Atomic bulk: list of [key, value] pairs
-                        try:
-                            pairs = json.loads(base64.b64decode(rest[0].encode()).decode())
-                            for k, v in pairs:
-                                self._store[k] = v
-                        except (json.JSONDecodeError, ValueError, TypeError):
-                            pass
-                elif op == "BULK_SET_LEGACY":
-                    if len(rest) == 2:
-                        self._store[rest[0]] = _decode_value(rest[1])
+            return False
+        return _replay_into(self._store, self._wal_path.read_bytes())
 
     def get(self, key: str) -> Optional[Any]:
         with self._lock:
             return self._store.get(key)
 
+    def digest_range(self, lo: Optional[str] = None, hi: Optional[str] = None) -> bytes:
+        """
+        SHA-256 over the keys in [lo, hi) (None: unbounded) in sorted order, hashing one
+        "key=value\n" line per key. str values hash as their text, others as compact sorted-key
+        JSON, so equal contents give equal digests whichever JSON library is installed.
+        """
+        with self._lock:
+            keys = sorted(k for k in self._store if (lo is None or k >= lo) and (hi is None or k < hi))
+            values = [self._store[k] for k in keys]
+        h = hashlib.sha256()
+        for k, v in zip(keys, values):
+            if not isinstance(v, str):
+                v = json.dumps(v, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+            h.update(f"{k}={v}\n".encode())
+        return h.digest()
+
     def set(
         self,
         key: str,
@@ -96,17 +382,27 @@ class KVStore:
         If debug_flaky > 0, with that probability we skip applying to in-memory store
         (WAL still written); simulates crash after fsync before apply. Replay recovers.
         """
-        wal_line = f"SET\t{key}\t{_encode_value(value)}"
-        self._wal_append_sync(wal_line)
-        if debug_flaky > 0 and random.random() < debug_flaky:
+        self._log_write(_set_record(key, value), ["set", key, value])
+        if debug_flaky and random.random() < debug_flaky:
+            self._flaky_skipped = True
             return  # Simulate not applying (replay will fix after restart)
         with self._lock:
             self._store[key] = value
 
+    def _delete_is_noop(self, key: str) -> bool:
+        """True if deleting key can skip the WAL: it is absent here and no flaky skip may have hidden it."""
+        return key not in self._store and not self._flaky_skipped
+
     def delete(self, key: str, *, debug_flaky: float = 0.0) -> None:
-        wal_line = f"DEL\t{key}"
-        self._wal_append_sync(wal_line)
-        if debug_flaky > 0 and random.random() < debug_flaky:
+        """
+        Delete key. Deleting an absent key is a no-op and writes nothing to the WAL, unless a
+        debug_flaky skip may have left that key in the WAL but not in memory (see _delete_is_noop).
+        """
+        if self._delete_is_noop(key):
+            return
+        self._log_write(_del_record(key), ["del", key])
+        if debug_flaky and random.random() < debug_flaky:
+            self._flaky_skipped = True
             return
         with self._lock:
             self._store.pop(key, None)
@@ -122,42 +418,67 @@ class KVStore:
         """
         if not items:
             return
-        # One WAL line: BULK_SET\t<base64(json list of [k,v] pairs)>
-        payload = [[k, v] for k, v in items]
-        raw = json.dumps(payload)
-        wal_line = "BULK_SET\t" + base64.b64encode(raw.encode()).decode()
-        self._wal_append_sync(wal_line)
-        if debug_flaky > 0 and random.random() < debug_flaky:
+        # One WAL line: BULK_SET\t<json list of [k,v] pairs>
+        self._log_write(_bulk_record(items), ["bulk", items])
+        if debug_flaky and random.random() < debug_flaky:
+            self._flaky_skipped = True
             return
         with self._lock:
-            for key, value in items:
-                self._store[key] = value
+            self._store.update(items)
 
     def replicate_apply_set(self, key: str, value: Any) -> None:
         """Apply a replicated SET (WAL + in-memory). Used by secondaries."""
-        wal_line = f"SET\t{key}\t{_encode_value(value)}"
-        self._wal_append_sync(wal_line)
+        self._wal_append_sync(_set_record(key, value))
         with self._lock:
             self._store[key] = value
 
     def replicate_apply_delete(self, key: str) -> None:
-        wal_line = f"DEL\t{key}"
-        self._wal_append_sync(wal_line)
+        if key not in self._store and not self._flaky_skipped:
+            return  # nothing to delete
+        self._wal_append_sync(_del_record(key))
         with self._lock:
             self._store.pop(key, None)
 
     def replicate_apply_bulk_set(self, items: list[tuple[str, Any]]) -> None:
         if not items:
             return
-        payload = [[k, v] for k, v in items]
-        raw = json.dumps(payload)
-        wal_line = "BULK_SET\t" + base64.b64encode(raw.encode()).decode()
-        self._wal_append_sync(wal_line)
+        self._wal_append_sync(_bulk_record(items))
+        with self._lock:
+            self._store.update(items)
+
+    def replicate_apply_batch(self, ops: list) -> None:
+        """
+        Apply an ordered batch of replicated ops with a single WAL fsync. Each op is
+        ["set", key, value], ["del", key] or ["bulk", [[key, value], ...]].
+        """
+        lines = []
+        for op in ops:
+            kind = op[0]
+            if kind == "set":
+                lines.append(_set_record(op[1], op[2]))
+            elif kind == "del":
+                lines.append(_del_record(op[1]))
+            elif kind == "bulk":
+                lines.append(_bulk_record(op[1]))
+            else:
+                raise ValueError(f"unknown replication op {kind!r}")
+        if not lines:
+            return
+        self._wal_append_sync(b"".join(lines))
         with self._lock:
-            for key, value in items:
-                self._store[key] = value
+            for op in ops:
+                if op[0] == "set":
+                    self._store[op[1]] = op[2]
+                elif op[0] == "del":
+                    self._store.pop(op[1], None)
+                else:
+                    self._store.update(op[1])
 
     def close(self) -> None:
-        if self._wal_file:
-            self._wal_file.close()
-            self._wal_file = None
+        if self._wal_thread is not None:
+            self._wal_q.put(None)  # the writer finishes what is queued ahead of this, then exits
+            self._wal_thread.join()
+            self._wal_thread = None
+        if self._wal_fd is not None:
+            os.close(self._wal_fd)
+            self._wal_fd = None
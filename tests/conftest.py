@@ -1,51 +1,60 @@
-"""Pytest fixtures: start/stop KV server in a temp dir."""
+"""Pytest fixtures: an in-process KV server per test (no subprocess, no startup sleep)."""
 
-import os
-import subprocess
-import time
-import shutil
-import tempfile
+import sys
+import threading
 import pytest
 from kvstore.client import KVClient
+from kvstore.cluster_runner import warm_forkserver
+from kvstore.server import KVHTTPServer
+from tests import helpers
 
 
-@pytest.fixture(scope="session")
-def server_port():
-    return 18765
-
-
-@pytest.fixture(scope="session")
-def data_dir():
-    d = tempfile.mkdtemp(prefix="kvstore_test_")
-    yield d
-    shutil.rmtree(d, ignore_errors=True)
-
-
-@pytest.fixture(scope="session")
-def server_process(server_port, data_dir):
-    env = os.environ.copy()
-    env["KV_DATA_DIR"] = data_dir
-    proc = subprocess.Popen(
-        [
-            "python", "-m", "kvstore.server",
-            "--port", str(server_port),
-            "--data-dir", data_dir,
-        ],
-        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-        env=env,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
-    time.sleep(1.2)
-    yield proc
-    proc.terminate()
-    try:
-        proc.wait(timeout=2)
-    except subprocess.TimeoutExpired:
-        proc.kill()
-    proc.wait(timeout=2)
+def pytest_addoption(parser):
+    parser.addoption("--fast", action="store_true", help="skip tests marked slow (server subprocesses)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getoption("--fast"):
+        return
+    skip = pytest.mark.skip(reason="slow test skipped by --fast")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _shared_clients():
+    """Close the clients cached by helpers.client_for once the session ends."""
+    yield
+    helpers.close_clients()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warm_forkserver(request):
+    """Boot the forkserver behind the first tests, so cluster fixtures fork nodes without waiting for it."""
+    if sys.platform != "win32" and not request.config.getoption("--fast"):
+        warm_forkserver()
+
+
+@pytest.fixture
+def free_port():
+    """A free TCP port for a subprocess server, so tests can run in parallel (pytest -n)."""
+    return helpers.free_port()
+
+
+@pytest.fixture
+def inproc_server(tmp_path):
+    """KVHTTPServer on an ephemeral port, served from a thread of the test process. Yields its base URL."""
+    server = KVHTTPServer(("127.0.0.1", 0), data_dir=str(tmp_path / "data"))
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()  # the socket is already listening, so requests can go out right away
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    thread.join(timeout=2)
 
 
 @pytest.fixture
-def client(server_process, server_port):
-    return KVClient(f"http://127.0.0.1:{server_port}")
+def client(inproc_server):
+    with KVClient(inproc_server) as c:
+        yield c
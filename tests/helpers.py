@@ -0,0 +1,124 @@
+"""Test helpers: bounded polling instead of fixed sleeps, and shared per-URL clients."""
+
+import signal
+import socket
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from kvstore.client import KVClient
+
+
+# SIGKILL where the platform has it; elsewhere (Windows) send_signal(SIGTERM) already kills outright.
+SIGKILL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+
+def reap(proc, sig: int = signal.SIGTERM, timeout: float = 2.0) -> None:
+    """
+    Stop a server process (Popen or cluster_runner.NodeProcess): send sig, poll every 20 ms until it
+    exits, and SIGKILL it if it is still running after timeout.
+    """
+    if proc.poll() is None:
+        try:
+            proc.send_signal(sig)
+        except ProcessLookupError:
+            pass  # exited in between
+    deadline = time.monotonic() + timeout
+    while proc.poll() is None:
+        if time.monotonic() >= deadline:
+            proc.kill()
+            proc.wait(timeout=2)
+            return
+        time.sleep(0.02)
+
+
+def _bindable(port: int, host: str = "127.0.0.1") -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+def free_port() -> int:
+    """A TCP port the OS reports free right now (a server started next will almost surely get it)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def free_ports(n: int = 3) -> int:
+    """First of n consecutive free ports, for the cluster runners (which use base_port + i)."""
+    while True:
+        base = free_port()
+        if base + n <= 65536 and all(_bindable(base + i) for i in range(1, n)):
+            return base
+
+
+def wait_port(port: int, timeout: float = 5.0, host: str = "127.0.0.1") -> None:
+    """Block until something accepts TCP connections on host:port (backoff from 5 ms), else raise."""
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        try:
+            socket.create_connection((host, port), 0.05).close()
+            return
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"nothing listening on {host}:{port} after {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
+def wait_until(predicate, timeout: float = 3.0, interval: float = 0.02) -> bool:
+    """Poll predicate() until it is true or timeout; returns its last result."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return bool(predicate())
+        time.sleep(interval)
+    return True
+
+
+def wait_key(client, key, expected, timeout: float = 3.0):
+    """Poll client.get(key) every 20 ms until it returns expected (or timeout); returns the last value."""
+    wait_until(lambda: client.get(key) == expected, timeout=timeout)
+    return client.get(key)
+
+
+def reset_node(url: str) -> None:
+    """Wipe one node through POST /_debug/reset (the node must run with KV_DEBUG_RESET=1)."""
+    req = urllib.request.Request(url + "/_debug/reset", data=b"", method="POST")
+    urllib.request.urlopen(req, timeout=5).read()
+
+
+_clients: dict[str, KVClient] = {}
+
+
+def client_for(url: str) -> KVClient:
+    """One KVClient (one keep-alive pool) per server URL, shared across tests; closed at session end."""
+    client = _clients.get(url)
+    if client is None:
+        client = _clients[url] = KVClient(url)
+    return client
+
+
+def close_clients() -> None:
+    """Close and forget every client handed out by client_for."""
+    for client in _clients.values():
+        client.close()
+    _clients.clear()
+
+
+def gets_parallel(urls: list[str], key, expected=None, timeout: float = 3.0) -> list:
+    """
+    get(key) from every node at once, one thread per URL. With expected, each thread polls its node
+    until replication delivers that value (or timeout), like wait_key.
+    """
+    def fetch(url):
+        client = client_for(url)
+        return client.get(key) if expected is None else wait_key(client, key, expected, timeout)
+
+    with ThreadPoolExecutor(max_workers=len(urls)) as ex:
+        return list(ex.map(fetch, urls))
@@ -2,16 +2,14 @@
 
 import os
 import subprocess
-import tempfile
-import time
-import shutil
 import pytest
 from kvstore.client import KVClient
+from tests.helpers import reap, wait_port, wait_until
 
 
 def _start_server_with_index(port: int, data_dir: str) -> subprocess.Popen:
     root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    return subprocess.Popen(
+    proc = subprocess.Popen(
         [
             "python", "-m", "kvstore.server",
             "--port", str(port),
@@ -22,57 +20,100 @@ def _start_server_with_index(port: int, data_dir: str) -> subprocess.Popen:
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
+    wait_port(port, timeout=10.0)  # importing sklearn makes this child slower to start
+    return proc
 
 
 def _stop_server(proc: subprocess.Popen) -> None:
-    proc.terminate()
-    try:
-        proc.wait(timeout=3)
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        proc.wait(timeout=2)
+    reap(proc)
 
 
-def test_fulltext_search():
+@pytest.mark.slow
+def test_fulltext_search(tmp_path, free_port):
     """Full-text search returns keys whose value contains all query words."""
-    data_dir = tempfile.mkdtemp(prefix="idx_")
-    port = 19500
-    try:
-        proc = _start_server_with_index(port, data_dir)
-        time.sleep(1.2)
-        c = KVClient(f"http://127.0.0.1:{port}")
-        c.set("doc1", "hello world python")
-        c.set("doc2", "world peace")
-        c.set("doc3", "python programming")
-        time.sleep(0.2)
-        keys = c.search("world")
-        assert set(keys) == {"doc1", "doc2"}
-        keys = c.search("python")
-        assert set(keys) == {"doc1", "doc3"}
-        keys = c.search("hello world")
-        assert "doc1" in keys
-        _stop_server(proc)
-    finally:
-        shutil.rmtree(data_dir, ignore_errors=True)
+    data_dir = str(tmp_path)
+    port = free_port
+    proc = _start_server_with_index(port, data_dir)
+    c = KVClient(f"http://127.0.0.1:{port}")
+    c.set("doc1", "hello world python")
+    c.set("doc2", "world peace")
+    c.set("doc3", "python programming")
+    wait_until(lambda: set(c.search("python")) == {"doc1", "doc3"})  # indexing is asynchronous
+    keys = c.search("world")
+    assert set(keys) == {"doc1", "doc2"}
+    keys = c.search("python")
+    assert set(keys) == {"doc1", "doc3"}
+    keys = c.search("hello world")
+    assert "doc1" in keys
+    _stop_server(proc)
 
 
-def test_embedding_search():
+@pytest.mark.slow
+def test_embedding_search(tmp_path, free_port):
     """Embedding similarity search returns keys by relevance (requires sklearn)."""
-    data_dir = tempfile.mkdtemp(prefix="idx_emb_")
-    port = 19501
+    data_dir = str(tmp_path)
+    port = free_port
+    proc = _start_server_with_index(port, data_dir)
+    c = KVClient(f"http://127.0.0.1:{port}")
+    c.set("a", "machine learning and artificial intelligence")
+    c.set("b", "cooking recipes and food")
+    c.set("c", "deep learning neural networks")
+    wait_until(lambda: "c" in [r[0] for r in c.search_similar("neural networks", top_k=3)])
+    results = c.search_similar("neural networks", top_k=3)
+    # c should be most similar
+    assert len(results) >= 1
+    keys = [r[0] for r in results]
+    assert "c" in keys
+    _stop_server(proc)
+
+
+def test_embedding_index_after_vocabulary_freeze(monkeypatch):
+    """Once the vocabulary is frozen, updates and removals only touch their own rows."""
+    pytest.importorskip("sklearn")
+    from kvstore import indexes
+    monkeypatch.setattr(indexes, "_REFIT_LIMIT", 3)
+    idx = indexes.IndexedStore()
+    idx.index_value("a", "machine learning")
+    idx.index_value("b", "cooking food")
+    idx.index_value("c", "neural networks")
+    idx.index_value("d", "neural cooking")  # frozen: transformed with the existing vocabulary
+    assert {k for k, _ in idx.embedding_search("neural", top_k=5)} == {"c", "d"}
+    idx.index_value("c", "machine food")
+    idx.remove_key("d")
+    assert idx.embedding_search("neural", top_k=5) == []
+    assert idx.embedding_search("machine", top_k=1)[0][0] in {"a", "c"}
+    idx.remove_key("a")  # not the last row: "c" is moved into its slot
+    assert [k for k, _ in idx.embedding_search("cooking", top_k=5)] == ["b"]
+    assert [k for k, _ in idx.embedding_search("machine", top_k=5)] == ["c"]
+
+
+def test_background_index_flush(tmp_path):
+    """Writes are indexed on a background thread; flush_index waits until they are searchable."""
+    from kvstore.indexed_store import KVStoreWithIndex
+    kv = KVStoreWithIndex(data_dir=str(tmp_path), enable_embedding=False)
     try:
-        proc = _start_server_with_index(port, data_dir)
-        time.sleep(1.2)
-        c = KVClient(f"http://127.0.0.1:{port}")
-        c.set("a", "machine learning and artificial intelligence")
-        c.set("b", "cooking recipes and food")
-        c.set("c", "deep learning neural networks")
-        time.sleep(0.2)
-        results = c.search_similar("neural networks", top_k=3)
-        # c should be most similar
-        assert len(results) >= 1
-        keys = [r[0] for r in results]
-        assert "c" in keys
-        _stop_server(proc)
+        kv.set("doc1", "hello world")
+        kv.bulk_set([("doc2", "world peace"), ("doc3", "python")])
+        kv.delete("doc3")
+        assert kv.flush_index(timeout=5)
+        assert set(kv.fulltext_search("world")) == {"doc1", "doc2"}
+        assert kv.fulltext_search("python") == []
     finally:
-        shutil.rmtree(data_dir, ignore_errors=True)
+        kv.close()
+
+
+def test_bulk_index_updates_embeddings_once_per_batch(monkeypatch):
+    """bulk_index refits once per batch below the refit limit, and only transforms once frozen."""
+    pytest.importorskip("sklearn")
+    from kvstore import indexes
+    monkeypatch.setattr(indexes, "_REFIT_LIMIT", 3)
+    idx = indexes.IndexedStore()
+    refits = []
+    real_refit = idx._refit
+    monkeypatch.setattr(idx, "_refit", lambda: (refits.append(1), real_refit()))
+    idx.bulk_index([("a", "machine learning"), ("b", "cooking food"), ("c", "neural networks")])
+    assert len(refits) == 1
+    idx.bulk_index([("d", "neural cooking"), ("e", "machine food"), ("a", "neural food")])
+    assert len(refits) == 1  # frozen: the batch is transformed with the existing vocabulary
+    assert {k for k, _ in idx.embedding_search("neural", top_k=5)} == {"a", "c", "d"}
+    assert set(idx.fulltext_search("food")) == {"a", "b", "e"}
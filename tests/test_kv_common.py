@@ -1,53 +1,60 @@
 """
 Common scenario tests using the KV client.
-Covers: Set then Get; Set then Delete then Get; Get without setting;
-Set then Set (same key) then Get; Set then exit (gracefully) then Get.
+Covers: Set then Get, including overwrites of the same key; Set then Delete then Get;
+Get without setting; Set then exit (gracefully) then Get.
 """
 
 import os
+import signal
+import socket
 import subprocess
-import tempfile
-import time
-import shutil
 import pytest
 from kvstore.client import KVClient
+from kvstore.store import KVStore
+from tests.helpers import SIGKILL, reap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
 def _start_server(port: int, data_dir: str) -> subprocess.Popen:
-    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    proc = subprocess.Popen(
-        ["python", "-m", "kvstore.server", "--port", str(port), "--data-dir", data_dir],
-        cwd=root,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
-    time.sleep(0.6)
-    return proc
+    """
+    Start a server on a socket bound and listening here, handed over with --fd. Connections queue in
+    its backlog while the child starts, so callers can send requests right away.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(("127.0.0.1", port))
+        s.listen(128)
+        return subprocess.Popen(
+            ["python", "-m", "kvstore.server", "--fd", str(s.fileno()), "--data-dir", data_dir],
+            cwd=ROOT,
+            pass_fds=(s.fileno(),),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
 
 
 def _stop_server(proc: subprocess.Popen, graceful: bool = True) -> None:
-    if graceful:
-        proc.terminate()
-    else:
-        proc.kill()
-    try:
-        proc.wait(timeout=3)
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        proc.wait(timeout=2)
-
-
-def test_set_then_get(client, server_process, server_port):
-    """Set a key then Get returns the value."""
-    client.set("k1", "v1")
-    assert client.get("k1") == "v1"
-    client.set("k2", 42)
-    assert client.get("k2") == 42
-    client.set("k3", {"a": 1})
-    assert client.get("k3") == {"a": 1}
-
-
-def test_set_then_delete_then_get(client, server_process, server_port):
+    reap(proc, signal.SIGTERM if graceful else SIGKILL)
+
+
+@pytest.mark.parametrize(
+    "k,writes",
+    [
+        ("k1", ["v1"]),
+        ("k2", [42]),
+        ("k3", [{"a": 1}]),
+        ("overwrite", ["first", "second", 999]),
+    ],
+)
+def test_set_then_get(client, k, writes):
+    """Set a key (again and again, for the overwrite cases) then Get returns the latest value."""
+    for v in writes:
+        client.set(k, v)
+        assert client.get(k) == v
+
+
+def test_set_then_delete_then_get(client):
     """Set then Delete then Get returns None."""
     client.set("d1", "x")
     assert client.get("d1") == "x"
@@ -55,45 +62,58 @@ def test_set_then_delete_then_get(client, server_process, server_port):
     assert client.get("d1") is None
 
 
-def test_get_without_setting(client, server_process, server_port):
+def test_get_without_setting(client):
     """Get without setting returns None."""
     assert client.get("nonexistent") is None
     assert client.get("also_missing") is None
 
 
-def test_set_then_set_same_key_then_get(client, server_process, server_port):
-    """Set then Set (same key) then Get returns the latest value."""
-    client.set("overwrite", "first")
-    assert client.get("overwrite") == "first"
-    client.set("overwrite", "second")
-    assert client.get("overwrite") == "second"
-    client.set("overwrite", 999)
-    assert client.get("overwrite") == 999
+@pytest.mark.slow
+def test_set_then_exit_gracefully_then_get(tmp_path, free_port):
+    """Set a key, stop server gracefully, start again with same data_dir, Get returns value."""
+    data_dir = str(tmp_path)
+    port = free_port
+    proc = _start_server(port, data_dir)
+    c = KVClient(f"http://127.0.0.1:{port}")
+    c.set("persist", "survives")
+    _stop_server(proc, graceful=True)
+    proc2 = _start_server(port, data_dir)
+    c2 = KVClient(f"http://127.0.0.1:{port}")
+    assert c2.get("persist") == "survives", "Data should persist after graceful restart"
+    _stop_server(proc2, graceful=True)
 
 
-def test_set_then_exit_gracefully_then_get():
-    """Set a key, stop server gracefully, start again with same data_dir, Get returns value."""
-    data_dir = tempfile.mkdtemp(prefix="kv_graceful_")
-    port = 19110
-    try:
-        proc = _start_server(port, data_dir)
-        time.sleep(1.2)
-        c = KVClient(f"http://127.0.0.1:{port}")
-        c.set("persist", "survives")
-        _stop_server(proc, graceful=True)
-        time.sleep(0.5)
-        proc2 = _start_server(port, data_dir)
-        time.sleep(1.2)
-        c2 = KVClient(f"http://127.0.0.1:{port}")
-        assert c2.get("persist") == "survives", "Data should persist after graceful restart"
-        _stop_server(proc2, graceful=True)
-    finally:
-        shutil.rmtree(data_dir, ignore_errors=True)
-
-
-def test_bulk_set_then_gets(client, server_process, server_port):
+def test_set_then_close_then_reopen_then_get(tmp_path):
+    """Same as the graceful restart above, in-process: close the store, open the data dir again."""
+    store = KVStore(data_dir=str(tmp_path))
+    store.set("persist", "survives")
+    store.close()
+    store2 = KVStore(data_dir=str(tmp_path))
+    assert store2.get("persist") == "survives"
+    store2.close()
+
+
+_BULK = [("b1", "v1"), ("b2", 2), ("b3", [1, 2, 3])]
+
+
+@pytest.mark.parametrize("k,v", _BULK)
+def test_bulk_set_then_gets(client, k, v):
     """BulkSet then Get for each key."""
-    client.bulk_set([("b1", "v1"), ("b2", 2), ("b3", [1, 2, 3])])
-    assert client.get("b1") == "v1"
-    assert client.get("b2") == 2
-    assert client.get("b3") == [1, 2, 3]
+    client.bulk_set(_BULK)
+    assert client.get(k) == v
+
+
+def test_bulk_set_stream_then_gets(client):
+    """bulk_set_stream splits an iterable into batches; every key is set."""
+    sent = client.bulk_set_stream(((f"s{i}", i) for i in range(10)), batch=3)
+    assert sent == 10
+    for i in range(10):
+        assert client.get(f"s{i}") == i
+
+
+def test_large_bulk_set_then_gets(client):
+    """A bulk above the NDJSON threshold is streamed line by line and fully applied."""
+    items = [(f"big{i}", {"i": i}) for i in range(200)]
+    client.bulk_set(items)
+    assert client.get("big0") == {"i": 0}
+    assert client.get("big199") == {"i": 199}
@@ -1,50 +1,71 @@
 """Tests for master-less cluster: all nodes accept writes and replicate to each other."""
 
-import tempfile
-import time
-import shutil
+import sys
+import urllib.request
 import pytest
-from kvstore.client import KVClient
-from kvstore.masterless_runner import run_masterless_cluster
+from kvstore._json import dumps
+from kvstore.masterless_runner import run_masterless_cluster, run_masterless_cluster_mp
+from tests.helpers import client_for, free_ports, gets_parallel, reap, reset_node, wait_until
+
+pytestmark = pytest.mark.slow  # every test here runs a 3-node cluster of server processes
+
+# Fork nodes from a forkserver where there is one; Windows keeps the subprocess runner.
+_run_masterless = run_masterless_cluster if sys.platform == "win32" else run_masterless_cluster_mp
 
 
 def _stop_procs(procs):
     for p in procs:
-        try:
-            p.terminate()
-            p.wait(timeout=2)
-        except Exception:
-            p.kill()
-            p.wait(timeout=2)
+        reap(p)
+
+
+@pytest.fixture(scope="module")
+def masterless_dirs(tmp_path_factory):
+    return [str(tmp_path_factory.mktemp(f"kv_ml_{i}")) for i in range(3)]
+
+
+@pytest.fixture(scope="module")
+def masterless_procs(masterless_dirs):
+    """Three-node master-less cluster shared by this module's tests (reset enabled)."""
+    base_port = free_ports(3)
+    procs = _run_masterless(base_port, data_dirs=masterless_dirs, env={"KV_DEBUG_RESET": "1"})
+    yield base_port
+    _stop_procs(procs)
 
 
 @pytest.fixture
-def masterless_dirs():
-    dirs = [tempfile.mkdtemp(prefix="kv_ml_") for _ in range(3)]
-    yield dirs
-    for d in dirs:
-        shutil.rmtree(d, ignore_errors=True)
+def masterless(masterless_procs):
+    """Base port of the shared cluster, with every node wiped before the test."""
+    for offset in (0, 1, 2):
+        reset_node(f"http://127.0.0.1:{masterless_procs + offset}")
+    return masterless_procs
 
 
-def test_masterless_write_any_node(masterless_dirs):
+def test_masterless_write_any_node(masterless):
     """Any node can accept writes; data replicates to others."""
-    base_port = 19600
-    procs = run_masterless_cluster(base_port, data_dirs=masterless_dirs)
-    try:
-        # Write to first node
-        c1 = KVClient(f"http://127.0.0.1:{base_port}")
-        c1.set("k1", "from_node_0")
-        time.sleep(1.0)
-        # Read from all nodes
-        for offset in [0, 1, 2]:
-            c = KVClient(f"http://127.0.0.1:{base_port + offset}")
-            assert c.get("k1") == "from_node_0"
-        # Write to second node
-        c2 = KVClient(f"http://127.0.0.1:{base_port + 1}")
-        c2.set("k2", "from_node_1")
-        time.sleep(1.0)
-        for offset in [0, 1, 2]:
-            c = KVClient(f"http://127.0.0.1:{base_port + offset}")
-            assert c.get("k2") == "from_node_1"
-    finally:
-        _stop_procs(procs)
+    urls = [f"http://127.0.0.1:{masterless + offset}" for offset in (0, 1, 2)]
+    # Write to first node, then read from all nodes
+    client_for(urls[0]).set("k1", "from_node_0")
+    assert gets_parallel(urls, "k1", "from_node_0") == ["from_node_0"] * 3
+    # Write to second node
+    client_for(urls[1]).set("k2", "from_node_1")
+    assert gets_parallel(urls, "k2", "from_node_1") == ["from_node_1"] * 3
+
+
+def test_masterless_delete_through_another_node(masterless):
+    """A delete sent to any node removes the key everywhere, even where that node never held it."""
+    urls = [f"http://127.0.0.1:{masterless + offset}" for offset in (0, 1, 2)]
+    client_for(urls[0]).set("k1", "v1")
+    assert gets_parallel(urls, "k1", "v1") == ["v1"] * 3
+    client_for(urls[1]).delete("k1")
+    assert wait_until(lambda: gets_parallel(urls, "k1") == [None] * 3)
+    # Only node 1 holds "only_1" (written through its replication endpoint, which does not fan out)
+    req = urllib.request.Request(
+        urls[1] + "/replicate/set",
+        data=dumps({"key": "only_1", "value": "x"}),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    urllib.request.urlopen(req, timeout=5).read()
+    assert gets_parallel(urls, "only_1") == [None, "x", None]
+    client_for(urls[0]).delete("only_1")
+    assert wait_until(lambda: gets_parallel(urls, "only_1") == [None] * 3)
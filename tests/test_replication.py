@@ -3,97 +3,91 @@ Replication tests: cluster of 3 (1 primary, 2 secondaries).
 - Writes/reads only to primary.
 - When primary goes down, election: one secondary becomes primary.
 - Verify writes after failover.
+The non-destructive tests share one cluster per module, wiped through /_debug/reset before each test.
 """
 
-import os
-import signal
-import subprocess
-import tempfile
-import time
-import shutil
+import sys
 import pytest
-from kvstore.client import KVClient
-from kvstore.cluster_runner import run_cluster, find_primary, elect_primary
+from kvstore.cluster_runner import run_cluster, run_cluster_mp, find_primary, elect_primary, wait_primary
+from tests.helpers import SIGKILL, client_for, free_ports, gets_parallel, reap, reset_node
+
+pytestmark = pytest.mark.slow  # every test here runs a 3-node cluster of server processes
+
+# Fork nodes from a forkserver where there is one; Windows keeps the subprocess runner.
+_run_cluster = run_cluster if sys.platform == "win32" else run_cluster_mp
 
 
 def _stop_procs(procs):
     for p in procs:
-        try:
-            p.terminate()
-            p.wait(timeout=2)
-        except (subprocess.TimeoutExpired, ProcessLookupError):
-            p.kill()
-            p.wait(timeout=2)
+        reap(p)
+
+
+@pytest.fixture(scope="module")
+def cluster_data_dirs(tmp_path_factory):
+    return [str(tmp_path_factory.mktemp(f"kv_rep_{i}")) for i in range(3)]
+
+
+@pytest.fixture(scope="module")
+def cluster_procs(cluster_data_dirs):
+    """One primary + two secondaries shared by this module's tests (reset enabled)."""
+    base_port = free_ports(3)
+    procs = _run_cluster(base_port, data_dirs=cluster_data_dirs, env={"KV_DEBUG_RESET": "1"})
+    yield base_port
+    _stop_procs(procs)
 
 
 @pytest.fixture
-def cluster_data_dirs():
-    dirs = [tempfile.mkdtemp(prefix="kv_rep_") for _ in range(3)]
-    yield dirs
-    for d in dirs:
-        shutil.rmtree(d, ignore_errors=True)
+def cluster(cluster_procs):
+    """Base port of the shared cluster, with every node wiped before the test."""
+    for offset in (0, 1, 2):
+        reset_node(f"http://127.0.0.1:{cluster_procs + offset}")
+    return cluster_procs
 
 
-def test_replication_primary_accepts_writes(cluster_data_dirs):
+def test_replication_primary_accepts_writes(cluster):
     """Writes and reads go to primary only."""
-    base_port = 19400
-    procs = run_cluster(base_port, data_dirs=cluster_data_dirs)
-    try:
-        primary_url = find_primary(base_port)
-        assert primary_url is not None, "No primary found"
-        client = KVClient(primary_url)
-        client.set("k1", "v1")
-        assert client.get("k1") == "v1"
-        client.bulk_set([("k2", "v2"), ("k3", "v3")])
-        assert client.get("k2") == "v2"
-        assert client.get("k3") == "v3"
-    finally:
-        _stop_procs(procs)
+    primary_url = find_primary(cluster)
+    assert primary_url is not None, "No primary found"
+    client = client_for(primary_url)
+    client.set("k1", "v1")
+    assert client.get("k1") == "v1"
+    client.bulk_set([("k2", "v2"), ("k3", "v3")])
+    assert client.get("k2") == "v2"
+    assert client.get("k3") == "v3"
 
 
-def test_replication_secondary_has_data_after_primary_write(cluster_data_dirs):
+def test_replication_secondary_has_data_after_primary_write(cluster):
     """After primary writes, secondaries should have the data (replication)."""
-    base_port = 19410
-    procs = run_cluster(base_port, data_dirs=cluster_data_dirs)
-    try:
-        primary_url = find_primary(base_port)
-        assert primary_url is not None
-        client = KVClient(primary_url)
-        client.set("repl_key", "repl_value")
-        time.sleep(1.5)  # allow replication to secondaries
-        # Read from secondary (port+1 or +2) - they should have the key
-        for offset in [1, 2]:
-            secondary_url = f"http://127.0.0.1:{base_port + offset}"
-            c2 = KVClient(secondary_url)
-            assert c2.get("repl_key") == "repl_value"
-    finally:
-        _stop_procs(procs)
+    primary_url = find_primary(cluster)
+    assert primary_url is not None
+    client = client_for(primary_url)
+    client.set("repl_key", "repl_value")
+    # Read from secondary (port+1 or +2) - they should have the key
+    secondary_urls = [f"http://127.0.0.1:{cluster + offset}" for offset in (1, 2)]
+    assert gets_parallel(secondary_urls, "repl_key", "repl_value") == ["repl_value"] * 2
 
 
-def test_replication_failover_election(cluster_data_dirs):
-    """When primary goes down, elect new primary; writes work on new primary."""
-    base_port = 19420
-    procs = run_cluster(base_port, data_dirs=cluster_data_dirs)
+def test_replication_failover_election(tmp_path_factory):
+    """When primary goes down, elect new primary; writes work on new primary. Kills a node, so it gets its own cluster."""
+    base_port = free_ports(3)
+    data_dirs = [str(tmp_path_factory.mktemp(f"kv_failover_{i}")) for i in range(3)]
+    procs = _run_cluster(base_port, data_dirs=data_dirs)
     try:
         primary_url = find_primary(base_port)
         assert primary_url is not None
-        client = KVClient(primary_url)
+        client = client_for(primary_url)
         client.set("before_failover", "value")
-        time.sleep(1.5)  # allow replication to secondaries before killing primary
+        # allow replication to secondaries before killing primary
+        gets_parallel([f"http://127.0.0.1:{base_port + offset}" for offset in (1, 2)], "before_failover", "value")
         # Kill primary (first process)
-        procs[0].send_signal(signal.SIGKILL) if hasattr(signal, "SIGKILL") else procs[0].kill()
-        try:
-            procs[0].wait(timeout=2)
-        except subprocess.TimeoutExpired:
-            procs[0].kill()
-            procs[0].wait(timeout=2)
-        time.sleep(0.5)
-        # No primary now
-        assert find_primary(base_port) is None or True  # might still see cached
-        # Elect new primary
+        reap(procs[0], SIGKILL)
+        # No primary now: the old one is dead and no secondary has been promoted yet
+        assert wait_primary(base_port, timeout=0.2) is None
+        # Elect new primary; the long poll wakes as soon as the promotion lands
         new_primary = elect_primary(base_port)
         assert new_primary is not None, "Election should promote one secondary"
-        client2 = KVClient(new_primary)
+        assert wait_primary(base_port, timeout=2.0) == new_primary
+        client2 = client_for(new_primary)
         # Data from before failover should be on new primary (it was a secondary with replicated data)
         assert client2.get("before_failover") == "value"
         # New writes work
@@ -0,0 +1,60 @@
+"""Unix domain socket transport: in-process servers bound to unix:/path, replication to a unix: peer."""
+
+import json
+import os
+import socket
+import threading
+import time
+import pytest
+from kvstore._unix import UnixHTTPConnection
+from kvstore.cluster_server import ClusterKVHTTPServer
+from kvstore.replicated_store import ReplicatedKVStore
+from kvstore.server import KVHTTPServer
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="no AF_UNIX on this platform")
+
+
+def _serve(server):
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    return t
+
+
+def _request(conn, method, path, body=None):
+    conn.request(method, path, body=json.dumps(body).encode() if body is not None else None,
+                 headers={"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read())
+
+
+def test_server_on_unix_socket(tmp_path):
+    sock_path = str(tmp_path / "kv.sock")
+    server = KVHTTPServer(f"unix:{sock_path}", data_dir=str(tmp_path / "data"))
+    _serve(server)
+    try:
+        conn = UnixHTTPConnection(sock_path)
+        assert _request(conn, "POST", "/set", {"key": "a", "value": [1, 2]}) == (200, {"ok": True})
+        assert _request(conn, "GET", "/get?key=a") == (200, {"found": True, "value": [1, 2]})
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not os.path.exists(sock_path)
+
+
+def test_replication_to_unix_peer(tmp_path):
+    sock_path = str(tmp_path / "secondary.sock")
+    secondary = ClusterKVHTTPServer(f"unix:{sock_path}", str(tmp_path / "s"), "secondary", [])
+    _serve(secondary)
+    primary = ReplicatedKVStore(data_dir=str(tmp_path / "p"), peer_urls=[f"unix:{sock_path}"])
+    try:
+        primary.set("k", "v")
+        primary.bulk_set([("b1", 1), ("b2", 2)])
+        deadline = time.monotonic() + 5
+        while secondary.kv.get("b2") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert secondary.kv.get("k") == "v" and secondary.kv.get("b2") == 2
+    finally:
+        primary.close()
+        secondary.shutdown()
+        secondary.server_close()
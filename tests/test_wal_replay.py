@@ -1,28 +1,227 @@
 """Direct test of WAL replay after bulk_set with debug_flaky (no server)."""
 
-import tempfile
-import shutil
+import binascii
+import hashlib
+import json
+import os
+import threading
+import pytest
 from kvstore.store import KVStore
+from tests.helpers import wait_until
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def test_bulk_set_wal_replay_after_skip_apply():
+
+def _encode(obj) -> bytes:
+    """JSON bytes for a hand-built WAL record; orjson when installed, so large payloads build fast."""
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+
+@pytest.fixture(scope="module")
+def wal_line_for():
+    """(items, encoded BULK_SET record) for n items; each size is built once per module."""
+    cache = {}
+
+    def mk(n):
+        if n not in cache:
+            items = [(f"k{i}", f"v{i}") for i in range(n)]
+            cache[n] = (items, b"BULK_SET\t" + _encode([[k, v] for k, v in items]) + b"\n")
+        return cache[n]
+
+    return mk
+
+
+@pytest.mark.parametrize("n", [5, 500, 50_000])
+def test_bulk_set_wal_replay_after_skip_apply(tmp_path, n, wal_line_for):
     """BulkSet with debug_flaky=1.0: WAL is written, apply skipped; new store replays and has keys."""
-    data_dir = tempfile.mkdtemp(prefix="wal_replay_")
-    try:
-        store = KVStore(data_dir=data_dir)
-        items = [(f"k{i}", f"v{i}") for i in range(5)]
-        # Force skip apply: patch would be cleaner; here we call _wal_append_sync then skip apply manually
-        payload = [[k, v] for k, v in items]
-        import json, base64
-        raw = json.dumps(payload)
-        wal_line = "BULK_SET\t" + base64.b64encode(raw.encode()).decode()
-        store._wal_append_sync(wal_line)
-        # Don't apply (simulate debug_flaky=1.0)
-        store.close()
-        # Reopen and replay
-        store2 = KVStore(data_dir=data_dir)
+    store = KVStore(data_dir=str(tmp_path))
+    items, line = wal_line_for(n)
+    # Force skip apply: patch would be cleaner; here we call _wal_append_sync then skip apply manually
+    store._wal_append_sync(line)
+    # Don't apply (simulate debug_flaky=1.0)
+    store.close()
+    # Reopen and replay
+    store2 = KVStore(data_dir=str(tmp_path))
+    assert store2.get("k0") == "v0"
+    assert store2.get(f"k{n - 1}") == f"v{n - 1}"
+    if n >= 50_000:  # one digest instead of n separate assertions
+        expected = hashlib.sha256(b"".join(f"{k}={v}\n".encode() for k, v in sorted(items))).digest()
+        assert store2.digest_range() == expected
+    else:
         for k, v in items:
             assert store2.get(k) == v, f"key {k}"
-        store2.close()
-    finally:
-        shutil.rmtree(data_dir, ignore_errors=True)
+    store2.close()
+
+
+def test_legacy_v1_wal_replayed_and_migrated(tmp_path):
+    """A WAL without the v2 header (raw keys, base64 JSON) still replays, and is rewritten as v2."""
+    data_dir = str(tmp_path)
+
+    def b64(v):
+        return binascii.b2a_base64(_encode(v), newline=False).decode()
+
+    with open(os.path.join(data_dir, "wal.log"), "w", encoding="utf-8") as f:
+        f.write(f"SET\ta\t{b64({'n': 1})}\n")
+        f.write(f"SET\tb\t{b64('x')}\n")
+        f.write("DEL\tb\n")
+        f.write(f"BULK_SET\t{b64([['c', 3], ['d', [4]]])}\n")
+    store = KVStore(data_dir=data_dir)
+    assert store.get("a") == {"n": 1} and store.get("b") is None
+    assert store.get("c") == 3 and store.get("d") == [4]
+    store.set("tab\tkey", "line\nbreak")
+    store.close()
+    with open(os.path.join(data_dir, "wal.log"), encoding="utf-8") as f:
+        assert f.readline() == '{"v":2}\n'
+    store2 = KVStore(data_dir=data_dir)
+    assert store2.get("a") == {"n": 1} and store2.get("d") == [4]
+    assert store2.get("tab\tkey") == "line\nbreak"
+    store2.close()
+
+
+def test_concurrent_sets_share_fsyncs_and_replay(tmp_path):
+    """Concurrent writers share the WAL writer's fsyncs; every acknowledged set is replayed."""
+    data_dir = str(tmp_path)
+    store = KVStore(data_dir=data_dir)
+
+    def writer(t):
+        for i in range(50):
+            store.set(f"t{t}_{i}", i)
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    store.close()
+    store2 = KVStore(data_dir=data_dir)
+    for t in range(8):
+        for i in range(50):
+            assert store2.get(f"t{t}_{i}") == i
+    store2.close()
+
+
+def test_checkpoint_snapshot_plus_wal_tail(tmp_path):
+    """checkpoint() folds the WAL (including skipped applies) into snapshot.json; replay = snapshot + tail."""
+    data_dir = str(tmp_path)
+    store = KVStore(data_dir=data_dir)
+    store.bulk_set([(f"k{i}", i) for i in range(100)])
+    store.set("skipped", "only in WAL", debug_flaky=1.0)
+    store.delete("k0")
+    store.checkpoint()
+    assert os.path.exists(os.path.join(data_dir, "snapshot.json"))
+    with open(os.path.join(data_dir, "wal.log"), encoding="utf-8") as f:
+        assert f.read() == '{"v":2}\n'
+    store.set("k1", "after")
+    store.close()
+    store2 = KVStore(data_dir=data_dir)
+    assert store2.get("k0") is None and store2.get("k1") == "after" and store2.get("k99") == 99
+    assert store2.get("skipped") == "only in WAL"
+    # size-triggered checkpoints keep the WAL bounded
+    store2.checkpoint_bytes = 1024
+    for i in range(200):
+        store2.set(f"n{i}", "x" * 20)
+    store2.close()
+    assert os.path.getsize(os.path.join(data_dir, "wal.log")) < 2048
+    store3 = KVStore(data_dir=data_dir)
+    assert store3.get("n199") == "x" * 20 and store3.get("k1") == "after"
+    store3.close()
+
+
+def test_delete_absent_key_skips_wal_unless_flaky_skipped(tmp_path):
+    """Deleting an absent key writes nothing, but a key left only in the WAL by debug_flaky is still deleted."""
+    data_dir = str(tmp_path)
+    store = KVStore(data_dir=data_dir)
+    wal_path = os.path.join(data_dir, "wal.log")
+    size = os.path.getsize(wal_path)
+    store.delete("never-set")
+    assert os.path.getsize(wal_path) == size
+    store.set("ghost", 1, debug_flaky=1.0)  # in the WAL, not in memory
+    store.delete("ghost")
+    store.close()
+    store2 = KVStore(data_dir=data_dir)
+    assert store2.get("ghost") is None
+    store2.close()
+
+
+def test_digest_range(tmp_path):
+    """digest_range hashes sorted "key=value" lines of [lo, hi); non-str values hash as compact JSON."""
+    store = KVStore(data_dir=str(tmp_path))
+    store.bulk_set([("a", "1"), ("b", {"y": 2, "x": [1]}), ("c", 3), ("d", None)])
+    expected = hashlib.sha256(b'b={"x":[1],"y":2}\nc=3\n').digest()
+    assert store.digest_range("b", "d") == expected
+    assert store.digest_range() == hashlib.sha256(b'a=1\nb={"x":[1],"y":2}\nc=3\nd=null\n').digest()
+    store.close()
+
+
+def test_reset_clears_memory_snapshot_and_wal(tmp_path):
+    """reset() leaves an empty store that stays empty after reopening; later writes still persist."""
+    store = KVStore(data_dir=str(tmp_path))
+    store.set("a", 1)
+    store.checkpoint()
+    store.set("b", 2)
+    store.reset()
+    assert store.get("a") is None and store.get("b") is None
+    assert not (tmp_path / "snapshot.json").exists()
+    store.set("c", 3)
+    store.close()
+    store2 = KVStore(data_dir=str(tmp_path))
+    assert store2.get("a") is None and store2.get("b") is None and store2.get("c") == 3
+    store2.close()
+
+
+def test_write_queued_behind_reset_survives_it(tmp_path, monkeypatch):
+    """A record queued right after a reset is written after the reset runs, not truncated by it."""
+    store = KVStore(data_dir=str(tmp_path))
+    store.set("a", 1)
+    release = threading.Event()
+    checkpoint_now = store._checkpoint_now
+
+    def blocked_checkpoint():
+        release.wait(5)
+        checkpoint_now()
+
+    # Hold the writer inside a checkpoint so the reset and the record below queue up together.
+    monkeypatch.setattr(store, "_checkpoint_now", blocked_checkpoint)
+    checkpoint = threading.Thread(target=store.checkpoint)
+    checkpoint.start()
+    resetter = threading.Thread(target=store.reset)
+    resetter.start()
+    assert wait_until(lambda: store._wal_q.qsize() == 1)
+    writer = threading.Thread(target=store.set, args=("b", 2))
+    writer.start()
+    assert wait_until(lambda: store._wal_q.qsize() == 2)
+    release.set()
+    for t in (checkpoint, resetter, writer):
+        t.join(5)
+    assert store.get("a") is None and store.get("b") == 2
+    store.close()
+    store2 = KVStore(data_dir=str(tmp_path))
+    assert store2.get("a") is None and store2.get("b") == 2
+    store2.close()
+
+
+def test_torn_tail_dropped_and_cut_before_next_append(tmp_path):
+    """A crash mid-record leaves a torn tail: replay ignores it, and the next write does not land on it."""
+    store = KVStore(data_dir=str(tmp_path))
+    store.set("a", 1)
+    store.close()
+    wal_path = tmp_path / "wal.log"
+    with open(wal_path, "ab") as f:
+        f.write(b'SET\t"n"\t12')  # torn from a longer number: parses, but was never written in full
+    store2 = KVStore(data_dir=str(tmp_path))
+    assert store2.get("a") == 1 and store2.get("n") is None
+    store2.close()
+    with open(wal_path, "ab") as f:
+        f.write(b'SET\t"b"\t{"x":')
+    store3 = KVStore(data_dir=str(tmp_path))
+    assert store3.get("b") is None
+    store3.set("acked", "must survive")
+    store3.close()
+    assert wal_path.read_bytes().endswith(b'\nSET\t"acked"\t"must survive"\n')
+    store4 = KVStore(data_dir=str(tmp_path))
+    assert store4.get("a") == 1 and store4.get("acked") == "must survive"
+    assert store4.get("b") is None and store4.get("n") is None
+    store4.close()